@@ -1,8 +1,21 @@
 from fastapi import FastAPI, HTTPException
 import requests
+import datetime
+import threading
+import time
+import yaml
+
+import net_test_shards
 
 app = FastAPI()
 
+# Load the config file
+with open("config.yaml", "r") as file:
+    config = yaml.safe_load(file)
+
+# Optional, every key has a default; see net_test_shards.py
+net_test_shards_config = config.get('net_test_shards') or {}
+
 services = {
     "webex": "http://webex:8000",
     "solarwinds": "http://solarwinds:8000",
@@ -36,4 +49,65 @@ def test_dnac_login():
     response = requests.get(f"{services['dnacenter']}/test_dnac_login")
     if response.status_code != 200:
         raise HTTPException(status_code=response.status_code, detail="Error fetching DNAC login")
-    return response.json()
\ No newline at end of file
+    return response.json()
+
+
+sharded_runs = {}
+sharded_lock = threading.Lock()
+
+
+def start_sharded_run():
+    with sharded_lock:
+        if any(run.state == 'running' for run in sharded_runs.values()):
+            raise RuntimeError("A sharded net_test run is already running")
+        run_id = datetime.datetime.now().strftime('R%Y%m%d%H%M%S')
+        sharded = net_test_shards.prepare_run(net_test_shards_config, run_id)
+        sharded.state = 'running'
+        sharded_runs[run_id] = sharded
+        # Keep the last few runs for GET /net_test/runs
+        for old_run_id in list(sharded_runs)[:-20]:
+            del sharded_runs[old_run_id]
+    threading.Thread(target=net_test_shards.complete_run, args=(sharded, net_test_shards_config),
+                     daemon=True).start()
+    return sharded
+
+
+def run_sharded_scheduler(interval):
+    while True:
+        started = time.monotonic()
+        try:
+            sharded = start_sharded_run()
+            while sharded.state == 'running':
+                time.sleep(5)
+        except Exception as e:
+            print(f"Scheduled sharded net_test run not started: {e!r}")
+        time.sleep(max(0, interval - (time.monotonic() - started)))
+
+
+@app.on_event("startup")
+def start_net_test_scheduler():
+    minutes = net_test_shards_config.get('schedule_minutes', 0)
+    if minutes:
+        threading.Thread(target=run_sharded_scheduler, args=(minutes * 60,), daemon=True).start()
+
+
+@app.post("/net_test/runs")
+def post_sharded_run():
+    """Start a net_test run sharded across the network_test workers; poll GET /net_test/runs/{run_id}."""
+    try:
+        sharded = start_sharded_run()
+    except (requests.RequestException, RuntimeError) as e:
+        raise HTTPException(status_code=503, detail=f"Cannot start sharded run: {e}")
+    return sharded.status()
+
+
+@app.get("/net_test/runs")
+def get_sharded_runs():
+    return [run.status() for run in sharded_runs.values()]
+
+
+@app.get("/net_test/runs/{run_id}")
+def get_sharded_run(run_id: str):
+    if run_id not in sharded_runs:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return sharded_runs[run_id].status()
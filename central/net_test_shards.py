@@ -0,0 +1,200 @@
+"""
+Sharded net_test runs: split the source list across network_test worker replicas and merge the rows.
+
+Sources are assigned to workers by rendezvous hashing on the source IP,
+so a router lands on the same worker every cycle and keeps its warm SSH
+session and cached DCs there. A worker's share is sent as shards of at most
+`shard_size` sources, one shard in flight per worker. When a worker fails
+a shard (connection error, timeout, 5xx) it is dropped for the rest of the
+run and its failed and pending sources are re-hashed over the workers
+still alive. The merged rows are written as one run by the network_test
+service, exactly like a local run.
+"""
+import datetime
+import hashlib
+import logging
+import socket
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+def discover_workers(settings):
+    """
+    Worker base URLs from net_test_shards.workers, or every address the worker service name resolves to.
+
+    With docker-compose replicas the service name resolves to one address per replica.
+    """
+    if settings.get('workers'):
+        return list(settings['workers'])
+    name = settings.get('worker_dns', 'network_test_worker')
+    port = settings.get('worker_port', 8000)
+    try:
+        addresses = sorted({info[4][0] for info in socket.getaddrinfo(name, port, proto=socket.IPPROTO_TCP)})
+    except socket.gaierror as e:
+        logger.error(f"Cannot resolve net_test workers at {name}: {e}")
+        return []
+    return [f"http://{address}:{port}" for address in addresses]
+
+
+def live_workers(workers, timeout=5):
+    alive = []
+    for worker in workers:
+        try:
+            if requests.get(f"{worker}/status", timeout=timeout).status_code == 200:
+                alive.append(worker)
+        except requests.RequestException as e:
+            logger.error(f"net_test worker {worker} is down: {e}")
+    return alive
+
+
+def rendezvous_worker(source_ip, workers):
+    """Highest random weight: only the sources of a removed worker move when the worker list changes."""
+    return max(workers, key=lambda worker: hashlib.md5(f"{worker}|{source_ip}".encode()).hexdigest())
+
+
+def error_results(destinations):
+    destination_names = ['Primary-DC', 'Secondary-DC'] + list(destinations)
+    return {name: ('ERROR', 'ERROR', 'ERROR') for name in destination_names}
+
+
+class ShardedRun:
+    """One sharded run; status() can be read from another thread while run() is going."""
+
+    def __init__(self, run_id, workers, sources, destinations, shard_size=250, shard_timeout=1800):
+        self.run_id = run_id
+        self.workers = list(workers)
+        self.sources = list(sources)
+        self.destinations = list(destinations)
+        self.shard_size = shard_size
+        self.shard_timeout = shard_timeout
+        self.pending = {worker: deque() for worker in self.workers}
+        self.dead = set()
+        self.rows = []
+        self.shard_count = 0
+        self.shards_done = 0
+        self.reassigned = 0
+        self.state = 'created'
+        self.started = None
+        self.finished = None
+        self.file = None
+        self.error = None
+
+    def assign(self, sources, workers):
+        shares = {worker: [] for worker in workers}
+        for source in sources:
+            shares[rendezvous_worker(source.split(' ')[1], workers)].append(source)
+        for worker, share in shares.items():
+            for start in range(0, len(share), self.shard_size):
+                self.shard_count += 1
+                self.pending[worker].append((self.shard_count, share[start:start + self.shard_size]))
+
+    def post_shard(self, worker, shard_id, sources):
+        response = requests.post(
+            f"{worker}/shards",
+            json={'run_id': self.run_id, 'shard_id': shard_id, 'sources': sources,
+                  'destinations': self.destinations},
+            timeout=(10, self.shard_timeout))
+        response.raise_for_status()
+        return response.json()['rows']
+
+    def fail_worker(self, worker, sources):
+        """Drop a worker for the rest of the run and spread its sources over the live ones."""
+        self.dead.add(worker)
+        orphans = list(sources)
+        while self.pending[worker]:
+            orphans.extend(self.pending[worker].popleft()[1])
+        alive = [w for w in self.workers if w not in self.dead]
+        self.reassigned += len(orphans)
+        if alive:
+            logger.error(f"Run {self.run_id}: reassigning {len(orphans)} sources of {worker} to {len(alive)} workers")
+            self.assign(orphans, alive)
+        else:
+            logger.error(f"Run {self.run_id}: no live workers left, {len(orphans)} sources get ERROR rows")
+            for source in orphans:
+                source_name, source_ip = source.split(' ')
+                self.rows.append([source_ip, source_name, error_results(self.destinations), 0])
+
+    def run(self):
+        """Run every shard and return the merged rows."""
+        self.state = 'running'
+        self.started = datetime.datetime.now().isoformat()
+        self.assign(self.sources, self.workers)
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=max(1, len(self.workers))) as executor:
+            while True:
+                busy = {worker for worker, _, _ in in_flight.values()}
+                for worker in self.workers:
+                    if worker in self.dead or worker in busy or not self.pending[worker]:
+                        continue
+                    shard_id, sources = self.pending[worker].popleft()
+                    future = executor.submit(self.post_shard, worker, shard_id, sources)
+                    in_flight[future] = (worker, shard_id, sources)
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    worker, shard_id, sources = in_flight.pop(future)
+                    try:
+                        self.rows.extend(future.result())
+                        self.shards_done += 1
+                    except (requests.RequestException, KeyError, ValueError) as e:
+                        logger.error(f"Run {self.run_id}: shard {shard_id} failed on {worker}: {e!r}")
+                        self.fail_worker(worker, sources)
+        return self.rows
+
+    def status(self):
+        return {
+            'run_id': self.run_id,
+            'state': self.state,
+            'started': self.started,
+            'finished': self.finished,
+            'workers': self.workers,
+            'dead_workers': sorted(self.dead),
+            'sources': len(self.sources),
+            'devices_done': len(self.rows),
+            'shards': self.shard_count,
+            'shards_done': self.shards_done,
+            'reassigned_sources': self.reassigned,
+            'file': self.file,
+            'error': self.error,
+        }
+
+
+def prepare_run(settings, run_id):
+    """Fetch the source and destination lists from network_test and find the live workers."""
+    results_url = settings.get('results_url', 'http://network_test:8000')
+    response = requests.get(f"{results_url}/inputs", timeout=30)
+    response.raise_for_status()
+    inputs = response.json()
+    workers = live_workers(discover_workers(settings))
+    if not workers:
+        raise RuntimeError("No live net_test workers")
+    return ShardedRun(run_id, workers, inputs['sources'], inputs['destinations'],
+                      shard_size=settings.get('shard_size', 250),
+                      shard_timeout=settings.get('shard_timeout', 1800))
+
+
+def complete_run(sharded, settings):
+    """Run every shard, then have network_test write the merged rows as one run. Never raises."""
+    results_url = settings.get('results_url', 'http://network_test:8000')
+    start = time.monotonic()
+    try:
+        rows = sharded.run()
+        response = requests.post(f"{results_url}/runs",
+                                 json={'destinations': sharded.destinations, 'rows': rows}, timeout=600)
+        response.raise_for_status()
+        sharded.file = response.json()['file']
+        sharded.state = 'done'
+    except Exception as e:
+        logger.exception(f"Sharded run {sharded.run_id} failed")
+        sharded.error = repr(e)
+        sharded.state = 'failed'
+    sharded.finished = datetime.datetime.now().isoformat()
+    print(f"Sharded run {sharded.run_id}: {len(sharded.rows)} devices on {len(sharded.workers)} workers in "
+          f"{time.monotonic() - start:.0f}s, {sharded.reassigned} sources reassigned")
+    return sharded
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import re
+
+import asyncssh
+
+import ios_parsers
+import ip_sla
+from dc_cache import DISCOVERY_COMMANDS, dc_ping_failed
+from precheck import split_host_port
+
+logger = logging.getLogger(__name__)
+
+# Matches an IOS exec prompt such as 'Branch-RTR-01#' or 'Branch-RTR-01>' at the end of the buffer
+PROMPT_PATTERN = re.compile(r'[\w.\-:/()]+[#>]\s*$')
+
+
+class IOSSession:
+    """
+    Interactive CLI session to a Cisco IOS device over asyncssh.
+
+    IOS does not reliably support several exec channels on one connection, so
+    commands are written to a single shell and the output is read back until
+    the device prompt shows up again (the same approach netmiko uses).
+    """
+
+    def __init__(self, host, conn, process):
+        self.host = host
+        self.conn = conn
+        self.process = process
+        self.prompt = None
+        self.closed = False
+
+    @classmethod
+    async def connect(cls, host, username, password, port=22, conn_timeout=60, read_timeout=30,
+                      keepalive_interval=0):
+        address, port = split_host_port(host, port)
+        conn = await asyncio.wait_for(
+            asyncssh.connect(address, port=port, username=username, password=password,
+                             known_hosts=None, client_keys=None,
+                             keepalive_interval=keepalive_interval),
+            timeout=conn_timeout)
+        try:
+            process = await conn.create_process(term_type='vt100', term_size=(511, 24))
+            session = cls(host, conn, process)
+            banner = await session._read_until(PROMPT_PATTERN.search, read_timeout)
+            session.prompt = banner.rstrip().splitlines()[-1].strip()
+            await session.send_command('terminal length 0', read_timeout=read_timeout)
+        except BaseException:
+            conn.close()
+            raise
+        return session
+
+    async def _read_until(self, is_done, read_timeout):
+        buffer = ''
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + read_timeout
+        while not is_done(buffer):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"Timed out waiting for prompt from {self.host}")
+            chunk = await asyncio.wait_for(self.process.stdout.read(65535), timeout=remaining)
+            if not chunk:
+                raise ConnectionError(f"Session to {self.host} closed")
+            buffer += chunk
+        return buffer
+
+    async def send_command(self, command, read_timeout=30):
+        """Send one command and return its output without the echo and trailing prompt."""
+        self.process.stdin.write(command + '\n')
+        if self.prompt:
+            pattern = re.compile(re.escape(self.prompt) + r'\s*$')
+        else:
+            pattern = PROMPT_PATTERN
+        output = await self._read_until(pattern.search, read_timeout)
+        output = output.replace('\r', '')
+        lines = output.rstrip().splitlines()
+        if lines and lines[0].strip() == command:
+            lines = lines[1:]
+        if lines and lines[-1].strip() == self.prompt:
+            lines = lines[:-1]
+        return '\n'.join(lines)
+
+    async def send_batch(self, commands, read_timeout=30):
+        """
+        Send several commands in one write and return one output chunk per command.
+
+        :param read_timeout: Allowance per command; the batch gets len(commands) times this
+        """
+        self.process.stdin.write('\n'.join(commands) + '\n')
+        output = await self._read_until(
+            lambda buffer: ios_parsers.batch_complete(buffer, self.prompt, len(commands)),
+            read_timeout * len(commands))
+        return ios_parsers.split_batch_output(output, self.prompt, len(commands))
+
+    async def send_config_set(self, commands, read_timeout=30):
+        """Apply config lines in one write; done once 'end' brings the exec prompt back."""
+        self.process.stdin.write('\n'.join(['configure terminal'] + list(commands) + ['end']) + '\n')
+        output = await self._read_until(
+            lambda buffer: buffer.replace('\r', '').rstrip().endswith(self.prompt), read_timeout)
+        return output.replace('\r', '')
+
+    def is_closed(self):
+        return self.closed or self.process.stdout.at_eof()
+
+    def close(self):
+        self.closed = True
+        self.conn.close()
+
+
+async def discover_dcs(session, source_ip, dc_cache, read_timeout=30):
+    """Find the primary and secondary DC from the routing table and cache them."""
+    def_route = await session.send_command(DISCOVERY_COMMANDS[0], read_timeout)
+    primary_dc_ip = ios_parsers.parse_primary_dc(def_route)
+    sec_route = await session.send_command(DISCOVERY_COMMANDS[1], read_timeout)
+    secondary_dc_ip = ios_parsers.parse_secondary_dc(sec_route, primary_dc_ip)
+    return dc_cache.put(source_ip, primary_dc_ip, secondary_dc_ip)
+
+
+async def run_pings(session, dests_ips, source_int, read_timeout=30, batch_pings=True):
+    commands = [f'ping {dest_ip} source {source_int}' for dest_ip in dests_ips]
+    if batch_pings:
+        outputs = await session.send_batch(commands, read_timeout)
+    else:
+        outputs = [await session.send_command(command, read_timeout) for command in commands]
+    return [ios_parsers.parse_ping(output).times for output in outputs]
+
+
+async def collect_sla(session, source_ip, dests_ips, source_int, destination_names, sla_state,
+                      read_timeout=30, batch_pings=True):
+    """Async counterpart of net_test.collect_sla."""
+    commands = sla_state.provision_commands(source_ip, dests_ips, source_int)
+    if commands:
+        await session.send_config_set(commands, read_timeout)
+        sla_state.provisioned(source_ip, dests_ips, source_int)
+        return dict(zip(destination_names,
+                        await run_pings(session, dests_ips, source_int, read_timeout, batch_pings)))
+    output = await session.send_command(ip_sla.STATISTICS_COMMAND, read_timeout)
+    results, complete = ip_sla.parse_results(output, sla_state.base_id, destination_names)
+    if not complete:
+        logger.error(f"IP SLA operations missing on {source_ip}")
+        sla_state.forget(source_ip)
+    return results
+
+
+async def ping_from_session(session, source_ip, destinations, dc_cache, read_timeout=30,
+                            batch_pings=True, sla_state=None):
+    """
+    Run every ping over an already logged-in session; returns the results dict.
+
+    :param sla_state: ip_sla.SlaState to read IP SLA statistics instead of pinging, None for pings
+    """
+    destination_names = ['Primary-DC', 'Secondary-DC'] + list(destinations)
+    dc = dc_cache.get(source_ip)
+    cached = dc is not None
+    if not cached:
+        dc = await discover_dcs(session, source_ip, dc_cache, read_timeout)
+    dests_ips = [dc['primary'], dc['secondary']] + list(destinations)
+    if sla_state is not None:
+        results = await collect_sla(session, source_ip, dests_ips, dc['source_int'], destination_names,
+                                    sla_state, read_timeout, batch_pings)
+    else:
+        results = dict(zip(destination_names,
+                           await run_pings(session, dests_ips, dc['source_int'], read_timeout, batch_pings)))
+
+    if cached and not dc.get('static') and dc_ping_failed(results):
+        # A cached DC that stops answering may have moved, check and re-ping only the DCs
+        try:
+            fresh = await discover_dcs(session, source_ip, dc_cache, read_timeout)
+        except (IndexError, ValueError) as e:
+            logger.error(f"DC re-discovery failed on {source_ip}: {e!r}")
+            dc_cache.invalidate(source_ip)
+            return results
+        if (fresh['primary'], fresh['secondary']) != (dc['primary'], dc['secondary']):
+            dc_results = await run_pings(session, [fresh['primary'], fresh['secondary']],
+                                         fresh['source_int'], read_timeout, batch_pings)
+            results.update(zip(destination_names[:2], dc_results))
+    return results
+
+
+async def revalidate_dcs(source_ip, dc_cache, pool, read_timeout=30):
+    """Background refresh of one cached entry over a pooled session, so the next cycle gets a cache hit."""
+    async def run(session):
+        return await discover_dcs(session, source_ip, dc_cache, read_timeout)
+    return await pool.run(source_ip, run)
+
+
+async def send_pings_async(source, destinations, dc_cache, username, password,
+                           conn_timeout=60, read_timeout=30, batch_pings=True, pool=None, sla_state=None):
+    """
+    Async counterpart of net_test.send_pings; returns the same (source_ip, source_name, results).
+
+    :param pool: Optional ssh_pool.SessionPool; without one the device gets a fresh login that is closed afterwards
+    """
+    source_name, source_ip = source.split(' ')
+
+    async def run(session):
+        return await ping_from_session(session, source_ip, destinations, dc_cache,
+                                       read_timeout=read_timeout, batch_pings=batch_pings,
+                                       sla_state=sla_state)
+
+    if pool is not None:
+        return source_ip, source_name, await pool.run(source_ip, run)
+
+    session = await IOSSession.connect(source_ip, username, password,
+                                       conn_timeout=conn_timeout, read_timeout=read_timeout)
+    try:
+        results = await run(session)
+    finally:
+        session.close()
+    return source_ip, source_name, results
+
+
+async def _run_device(semaphore, source, destinations, dc_cache, username, password,
+                      device_timeout, conn_timeout, read_timeout, batch_pings, pool, sla_state, on_result):
+    async with semaphore:
+        start = asyncio.get_running_loop().time()
+        try:
+            result = await asyncio.wait_for(
+                send_pings_async(source, destinations, dc_cache, username, password,
+                                 conn_timeout=conn_timeout, read_timeout=read_timeout,
+                                 batch_pings=batch_pings, pool=pool, sla_state=sla_state),
+                timeout=device_timeout)
+        except Exception as e:
+            source_name, source_ip = source.split(' ')
+            print(f"Failed to connect or send command to {source_ip}: {e!r}")
+            logger.error(f"Failed to connect or send command to {source_ip}: {e!r}")
+            destination_names = ['Primary-DC', 'Secondary-DC'] + list(destinations)
+            result = source_ip, source_name, {name: ('ERROR', 'ERROR', 'ERROR') for name in destination_names}
+        if on_result is not None:
+            on_result(*result, asyncio.get_running_loop().time() - start)
+        return result
+
+
+async def run_async_pings(sources, destinations, dc_cache, username, password,
+                          concurrency=200, device_timeout=300, conn_timeout=60, read_timeout=30,
+                          batch_pings=True, pool=None, sla_state=None, on_result=None):
+    """
+    Run send_pings_async against every source with at most `concurrency` sessions open.
+
+    :param device_timeout: Hard limit in seconds for one device, login included
+    :param batch_pings: Send every ping to a device in one write instead of one round trip each
+    :param pool: Optional ssh_pool.SessionPool to reuse logins across runs
+    :param sla_state: Optional ip_sla.SlaState to collect IP SLA statistics instead of pinging
+    :param on_result: Optional callback(source_ip, source_name, results, elapsed) run as each device finishes
+    :return: List of (source_ip, source_name, results) in the same order as `sources`
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [
+        _run_device(semaphore, source, destinations, dc_cache, username, password,
+                    device_timeout, conn_timeout, read_timeout, batch_pings, pool, sla_state, on_result)
+        for source in sources
+    ]
+    return await asyncio.gather(*tasks)
+
+
+def run_engine(sources, destinations, dc_cache, username, password, **kwargs):
+    """Blocking entry point used by net_test.main()."""
+    return asyncio.run(run_async_pings(sources, destinations, dc_cache, username, password, **kwargs))
@@ -0,0 +1,138 @@
+"""
+End-to-end load benchmark of the net_test engines against the ios_sim.py fleet.
+
+Starts the simulator in its own process, then runs each engine in a fresh
+process (so peak memory is per engine) from a scratch directory holding a
+generated config.yaml and source lists. Reports devices/minute, p50/p95
+per-device time and peak RSS.
+
+    python bench_fleet.py --devices 5000 --engine both --concurrency 500 --latency-ms 40 --dead 0.02
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def write_workdir(workdir, sources_file, args):
+    with open(os.path.join(workdir, 'config.yaml'), 'w') as file:
+        json.dump({
+            # JSON is valid YAML, and avoids a PyYAML dump dependency here
+            'network_devices': {'cli_username': 'bench', 'cli_password': 'bench'},
+            'net_test': {
+                'max_workers': args.max_workers,
+                'concurrency': args.concurrency,
+                'batch_pings': not args.no_batch,
+                'precheck': not args.no_precheck,
+                'precheck_timeout': 2,
+            },
+        }, file)
+    with open(os.path.join(workdir, 'test_destinations.txt'), 'w') as file:
+        file.write('\n'.join(f'8.8.{i}.8' for i in range(args.destinations)) + '\n')
+    with open(os.path.join(workdir, 'single_DC_sites.txt'), 'w') as file:
+        file.write('')
+    with open(sources_file, 'r') as src, open(os.path.join(workdir, 'office_wan_devices.txt'), 'w') as dst:
+        dst.write(src.read())
+
+
+def run_one(engine):
+    """Child process: run one engine from the current (scratch) directory and print a JSON report."""
+    sys.path.insert(0, HERE)
+    import ios_sim
+    ios_sim.raise_fd_limit()
+    import net_test
+
+    elapsed = []
+
+    def on_result(source_ip, source_name, results, device_elapsed):
+        elapsed.append(device_elapsed)
+
+    sources = net_test.sources
+    start = time.monotonic()
+    if net_test.net_test_config.get('precheck', True):
+        sources, unreachable, _ = net_test.precheck.split_reachable(sources, **net_test.precheck_settings())
+        elapsed.extend(0 for _ in unreachable)
+    net_test.ENGINES[engine](sources, net_test.destinations, on_result)
+    wall = time.monotonic() - start
+
+    elapsed.sort()
+    report = {
+        'engine': engine,
+        'devices': len(net_test.sources),
+        'wall_s': round(wall, 1),
+        'devices_per_min': round(len(net_test.sources) / wall * 60, 1),
+        'p50_device_s': round(statistics.median(elapsed), 2),
+        'p95_device_s': round(elapsed[int(0.95 * (len(elapsed) - 1))], 2),
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    print('REPORT ' + json.dumps(report), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load benchmark for net_test against a simulated fleet')
+    parser.add_argument('--engine', choices=['thread', 'async', 'both'], default='both')
+    parser.add_argument('--devices', type=int, default=500)
+    parser.add_argument('--destinations', type=int, default=3)
+    parser.add_argument('--max-workers', type=int, default=30, help='Thread engine pool size')
+    parser.add_argument('--concurrency', type=int, default=200, help='Async engine session limit')
+    parser.add_argument('--no-batch', action='store_true', help='One send_command per ping')
+    parser.add_argument('--no-precheck', action='store_true')
+    parser.add_argument('--base-port', type=int, default=20000)
+    parser.add_argument('--latency-ms', type=float, default=30)
+    parser.add_argument('--loss', type=float, default=0.0)
+    parser.add_argument('--auth-delay', type=float, default=0.2)
+    parser.add_argument('--dead', type=float, default=0.0)
+    parser.add_argument('--dead-mode', choices=['refuse', 'hang'], default='refuse')
+    parser.add_argument('--run-one', choices=['thread', 'async'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(args.run_one)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='net_test_bench_')
+    sources_file = os.path.join(workdir, 'sim_sources.txt')
+    simulator = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'ios_sim.py'), '--devices', str(args.devices),
+         '--base-port', str(args.base_port), '--latency-ms', str(args.latency_ms), '--loss', str(args.loss),
+         '--auth-delay', str(args.auth_delay), '--dead', str(args.dead), '--dead-mode', args.dead_mode,
+         '--sources-file', sources_file],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        ready = simulator.stdout.readline()
+        if not ready.startswith('READY'):
+            raise SystemExit(f"Simulator did not start: {ready!r}")
+        print(ready.strip())
+        write_workdir(workdir, sources_file, args)
+
+        engines = ['thread', 'async'] if args.engine == 'both' else [args.engine]
+        reports = []
+        for engine in engines:
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-one', engine],
+                                   cwd=workdir, capture_output=True, text=True)
+            lines = [line for line in child.stdout.splitlines() if line.startswith('REPORT ')]
+            if not lines:
+                print(child.stdout[-2000:], child.stderr[-2000:])
+                raise SystemExit(f"{engine} engine run failed")
+            reports.append(json.loads(lines[-1][len('REPORT '):]))
+    finally:
+        simulator.terminate()
+        simulator.wait()
+
+    print(f"\n{'engine':<8}{'devices':>9}{'wall s':>9}{'dev/min':>10}{'p50 s':>8}{'p95 s':>8}{'peak MB':>9}")
+    for report in reports:
+        print(f"{report['engine']:<8}{report['devices']:>9}{report['wall_s']:>9}{report['devices_per_min']:>10}"
+              f"{report['p50_device_s']:>8}{report['p95_device_s']:>8}{report['peak_rss_mb']:>9}")
+    print(f"\nScratch directory (generated config and source lists): {workdir}")
+
+
+if __name__ == '__main__':
+    main()
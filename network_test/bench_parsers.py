@@ -0,0 +1,106 @@
+"""
+Parser benchmark over the recorded IOS / IOS-XE outputs in corpus/.
+
+Every corpus file is first checked against corpus/expected.json, then each
+parser is run in a tight loop and the parses/sec are reported, along with
+how long parsing a whole fleet's output would take.
+
+    python bench_parsers.py --devices 10000 --destinations 5
+"""
+import argparse
+import json
+import os
+import time
+
+import ios_parsers
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+
+def run_parser(case, output):
+    """Parse one corpus file and return the fields expected.json checks."""
+    parser = case['parser']
+    if parser == 'ping':
+        result = ios_parsers.parse_ping(output)
+        return {'target': result.target, 'received': result.received, 'sent': result.sent,
+                'times': list(result.times)}
+    if parser == 'route':
+        return {'next_hops': ios_parsers.parse_route(output).next_hops}
+    if parser == 'bgp':
+        return {'next_hops': ios_parsers.parse_bgp(output).next_hops}
+    if parser == 'sla':
+        return {str(operation): {'received': result.received, 'sent': result.sent, 'times': list(result.times)}
+                for operation, result in ios_parsers.parse_sla_statistics(output).items()}
+    if parser == 'batch':
+        chunks = ios_parsers.split_batch_output(output, case['prompt'], case['count'])
+        return {'times': [list(ios_parsers.parse_ping(chunk).times) for chunk in chunks]}
+    raise ValueError(f"Unknown parser {parser}")
+
+
+def load_corpus():
+    with open(os.path.join(CORPUS_DIR, 'expected.json'), 'r') as file:
+        cases = json.load(file)
+    corpus = []
+    for filename, case in cases.items():
+        with open(os.path.join(CORPUS_DIR, filename), 'r') as file:
+            corpus.append((filename, case, file.read()))
+    return corpus
+
+
+def check_corpus(corpus):
+    """Raise if any parser disagrees with expected.json; a fast wrong parser is no use."""
+    failures = []
+    for filename, case, output in corpus:
+        parsed = run_parser(case, output)
+        if parsed != case['expected']:
+            failures.append(f"{filename}: expected {case['expected']}, got {parsed}")
+    if failures:
+        raise SystemExit('Corpus check failed:\n' + '\n'.join(failures))
+
+
+def benchmark(corpus, min_time=0.5):
+    """parses/sec for each corpus file, each timed for at least `min_time` seconds."""
+    rates = {}
+    for filename, case, output in corpus:
+        iterations = 0
+        batch = 100
+        start = time.perf_counter()
+        while True:
+            for _ in range(batch):
+                run_parser(case, output)
+            iterations += batch
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        rates[filename] = iterations / elapsed
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the IOS output parsers')
+    parser.add_argument('--devices', type=int, default=10000, help='Fleet size for the projection')
+    parser.add_argument('--destinations', type=int, default=5, help='Lines in test_destinations.txt')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Seconds to time each corpus file')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    check_corpus(corpus)
+    print(f"Corpus OK: {len(corpus)} recorded outputs match expected.json\n")
+
+    rates = benchmark(corpus, args.min_time)
+    width = max(len(filename) for filename in rates)
+    for filename, rate in rates.items():
+        print(f"{filename:<{width}}  {rate:>12,.0f} parses/sec")
+
+    # Worst case per device: DC discovery (route + BGP) plus one ping per DC and destination
+    parsers = {filename: case['parser'] for filename, case, _ in corpus}
+    ping_rate = min(rate for filename, rate in rates.items() if parsers[filename] == 'ping')
+    route_rate = min(rate for filename, rate in rates.items() if parsers[filename] in ('route', 'bgp'))
+    per_device = 2 / route_rate + (2 + args.destinations) / ping_rate
+    print(f"\nWorst-case parse time per device: {per_device * 1000:.3f} ms "
+          f"({2 + args.destinations} pings + route + BGP)")
+    print(f"Projected parse time for {args.devices:,} devices: {per_device * args.devices:.2f} s of CPU")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DISCOVERY_COMMANDS = ('show ip route 0.0.0.0 | i , from', 'show ip bgp 0.0.0.0 | i from 1')
+
+
+class DCCache:
+    """
+    Primary/secondary DC and ping source interface per router, persisted to a JSON file.
+
+    Entries from single_DC_sites.txt are static and never expire. Discovered
+    entries are trusted for `ttl` seconds; after that get() misses and the
+    caller runs discovery again. Safe to share between threads.
+    """
+
+    def __init__(self, filename='dc_cache.json', ttl=86400, single_dc_sites=None):
+        self.filename = filename
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._static = {}
+        self._dirty = False
+        self.load()
+        if single_dc_sites:
+            self.load_static(single_dc_sites)
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, 'r') as file:
+                entries = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring unreadable DC cache {self.filename}: {e}")
+            return
+        with self._lock:
+            self._entries = entries
+
+    def load_static(self, single_dc_sites):
+        """Merge get_single_DC_sites() output; these sites always ping their one DC twice."""
+        static = {
+            source_ip: {'primary': site['DC'], 'secondary': site['DC'], 'source_int': site['source_int'],
+                        'static': True}
+            for source_ip, site in single_dc_sites.items()
+        }
+        with self._lock:
+            self._static = static
+
+    def get(self, source_ip):
+        """Return the cached entry for a router, or None if unknown or past the TTL."""
+        with self._lock:
+            if source_ip in self._static:
+                return self._static[source_ip]
+            entry = self._entries.get(source_ip)
+        if entry is None or time.time() - entry['discovered'] > self.ttl:
+            return None
+        return entry
+
+    def put(self, source_ip, primary, secondary, source_int='lo0'):
+        """Store a discovery result and return the new entry."""
+        entry = {'primary': primary, 'secondary': secondary, 'source_int': source_int,
+                 'discovered': time.time()}
+        with self._lock:
+            previous = self._entries.get(source_ip)
+            if previous and (previous['primary'], previous['secondary']) != (primary, secondary):
+                logger.info(f"DC change on {source_ip}: {previous['primary']}/{previous['secondary']} -> {primary}/{secondary}")
+            self._entries[source_ip] = entry
+            self._dirty = True
+        return entry
+
+    def invalidate(self, source_ip):
+        with self._lock:
+            if self._entries.pop(source_ip, None) is not None:
+                self._dirty = True
+
+    def stale(self, within=0):
+        """Routers whose discovered entry expires in the next `within` seconds (or already has)."""
+        cutoff = time.time() - self.ttl + within
+        with self._lock:
+            return [source_ip for source_ip, entry in self._entries.items()
+                    if entry['discovered'] < cutoff and source_ip not in self._static]
+
+    def save(self):
+        """Write the discovered entries if anything changed; atomic so a crash never leaves half a file."""
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = dict(self._entries)
+            self._dirty = False
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as file:
+            json.dump(entries, file, indent=1)
+        os.replace(tmp_filename, self.filename)
+
+
+def dc_ping_failed(results):
+    """True if the ping to either DC got nothing back, which is the hint a cached DC moved."""
+    return results.get('Primary-DC', (None,))[0] is None or results.get('Secondary-DC', (None,))[0] is None
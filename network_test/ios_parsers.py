@@ -0,0 +1,179 @@
+"""
+Parsers for the IOS / IOS-XE output net_test reads: ping, IP SLA statistics, the default route and its BGP paths.
+
+Patterns are compiled once at import and every parser returns a small
+result object instead of raw match groups. The recorded outputs in
+corpus/ cover each case and bench_parsers.py measures parses/sec over them.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+IPV4 = r'(?:\d{1,3}\.){3}\d{1,3}'
+
+# '  * 10.255.0.1, from 10.255.0.1, 1w2d ago' (the line 'show ip route 0.0.0.0 | i , from' keeps)
+ROUTE_DESCRIPTOR = re.compile(r'^\s*\*?\s*(' + IPV4 + r'), from (' + IPV4 + r')', re.MULTILINE)
+# '    10.255.0.2 (metric 20) from 10.255.0.2 (10.255.255.2)' (the lines 'show ip bgp 0.0.0.0 | i from 1' keeps)
+BGP_PATH = re.compile(r'^\s*(' + IPV4 + r')(?: \(metric \d+\))? from (' + IPV4 + r') \((' + IPV4 + r')\)', re.MULTILINE)
+PING_TARGET = re.compile(r'Sending (\d+), (\d+)-byte ICMP Echos to (\S+?),')
+PING_SUMMARY = re.compile(
+    r'Success rate is (\d+) percent \((\d+)/(\d+)\)(?:, round-trip min/avg/max = (\d+)/(\d+)/(\d+) ms)?')
+PING_ERROR = re.compile(r'^% (.+)$', re.MULTILINE)
+# One block per operation in 'show ip sla statistics' and 'show ip sla statistics aggregated'
+SLA_OPERATION = re.compile(r'^\s*IPSLA operation id: (\d+)', re.MULTILINE)
+SLA_AGGREGATED_RTT = re.compile(r'Number Of RTT: (\d+)\s+RTT Min/Avg/Max: (\d+)/(\d+)/(\d+)')
+SLA_LATEST_RTT = re.compile(r'Latest RTT: (\d+) milliseconds')
+SLA_SUCCESSES = re.compile(r'Number of successes: (\d+)')
+SLA_FAILURES = re.compile(r'Number of failures: (\d+)')
+
+
+@dataclass
+class RouteResult:
+    """Next hops of the default route, in the order the router lists them."""
+    next_hops: List[str] = field(default_factory=list)
+
+
+@dataclass
+class BgpResult:
+    """BGP paths for the default route as (next hop, peer, router id)."""
+    paths: List[tuple] = field(default_factory=list)
+
+    @property
+    def next_hops(self):
+        return [path[0] for path in self.paths]
+
+
+@dataclass
+class PingResult:
+    target: Optional[str] = None
+    sent: int = 0
+    received: int = 0
+    success_percent: Optional[int] = None
+    min_ms: Optional[int] = None
+    avg_ms: Optional[int] = None
+    max_ms: Optional[int] = None
+    error: Optional[str] = None
+
+    @property
+    def loss(self):
+        """Fraction of echoes lost, None if the ping never ran."""
+        if not self.sent:
+            return None
+        return 1 - self.received / self.sent
+
+    @property
+    def times(self):
+        """(min, avg, max) as strings the way the CSV has always held them, (None, None, None) if nothing came back."""
+        if self.min_ms is None:
+            return (None, None, None)
+        return str(self.min_ms), str(self.avg_ms), str(self.max_ms)
+
+
+def parse_route(output):
+    return RouteResult(next_hops=[match.group(1) for match in ROUTE_DESCRIPTOR.finditer(output)])
+
+
+def parse_bgp(output):
+    return BgpResult(paths=[match.groups() for match in BGP_PATH.finditer(output)])
+
+
+def parse_primary_dc(def_route):
+    """Return the primary DC next hop from 'show ip route 0.0.0.0 | i , from'."""
+    route = parse_route(def_route)
+    if not route.next_hops:
+        raise ValueError(f"No default route next hop in {def_route!r}")
+    return route.next_hops[0]
+
+
+def parse_secondary_dc(sec_route, primary_dc_ip):
+    """Return the secondary DC peer from 'show ip bgp 0.0.0.0 | i from 1'."""
+    others = [next_hop for next_hop in parse_bgp(sec_route).next_hops if next_hop != primary_dc_ip]
+    if not others:
+        raise ValueError(f"No BGP path other than {primary_dc_ip} in {sec_route!r}")
+    return others[0]
+
+
+def parse_ping(output):
+    """
+    Parse the output of an IOS ping.
+
+    Partial loss keeps its round-trip times; 0% success, a timeout or a
+    '% ...' error leaves them None.
+
+    :param output: Raw CLI output of 'ping <dest> source <int>'
+    :return: PingResult
+    """
+    result = PingResult()
+    target = PING_TARGET.search(output)
+    if target:
+        result.target = target.group(3)
+    summary = PING_SUMMARY.search(output)
+    if summary:
+        result.success_percent = int(summary.group(1))
+        result.received = int(summary.group(2))
+        result.sent = int(summary.group(3))
+        if summary.group(4) is not None and result.received > 0:
+            result.min_ms, result.avg_ms, result.max_ms = (int(value) for value in summary.group(4, 5, 6))
+    else:
+        error = PING_ERROR.search(output)
+        if error:
+            result.error = error.group(1).strip()
+    return result
+
+
+def parse_sla_block(block):
+    """One operation's statistics as a PingResult: sent/received from the success and failure counts."""
+    result = PingResult()
+    # The aggregated view repeats the counters once per hourly bucket, the newest last
+    block = block.split('Start Time Index:')[-1]
+    successes = SLA_SUCCESSES.search(block)
+    failures = SLA_FAILURES.search(block)
+    if successes and failures:
+        result.received = int(successes.group(1))
+        result.sent = result.received + int(failures.group(1))
+        if result.sent:
+            result.success_percent = result.received * 100 // result.sent
+    aggregated = SLA_AGGREGATED_RTT.search(block)
+    latest = SLA_LATEST_RTT.search(block)
+    if aggregated and int(aggregated.group(1)) > 0:
+        result.min_ms, result.avg_ms, result.max_ms = (int(value) for value in aggregated.group(2, 3, 4))
+    elif not aggregated and latest:
+        result.min_ms = result.avg_ms = result.max_ms = int(latest.group(1))
+    return result
+
+
+def parse_sla_statistics(output):
+    """
+    Parse 'show ip sla statistics [aggregated]' into one PingResult per operation.
+
+    The aggregated view gives min/avg/max over the newest hourly bucket; the
+    plain view only has the latest RTT, which is used for all three.
+
+    :return: {operation id: PingResult}
+    """
+    matches = list(SLA_OPERATION.finditer(output))
+    operations = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(output)
+        operations[int(match.group(1))] = parse_sla_block(output[match.end():end])
+    return operations
+
+
+def batch_complete(output, prompt, count):
+    """True once `count` commands sent in one batch have all returned to the prompt."""
+    output = output.replace('\r', '')
+    return output.count(prompt) >= count and output.rstrip().endswith(prompt)
+
+
+def split_batch_output(output, prompt, count):
+    """
+    Split the output of commands sent in one batch into one chunk per command.
+
+    The device prints its prompt once each command has finished, so the text
+    between two prompts belongs to exactly one command, in the order sent.
+
+    :return: List of `count` output chunks, padded with '' if the device stopped early
+    """
+    chunks = output.replace('\r', '').split(prompt)
+    chunks = chunks[:count]
+    return chunks + [''] * (count - len(chunks))
@@ -0,0 +1,236 @@
+"""
+Simulated Cisco IOS SSH fleet for load testing net_test without touching real routers.
+
+Starts one asyncssh server per simulated router on consecutive localhost
+ports. Each one answers the commands send_pings uses (default route, BGP
+paths, ping ... source ..., and for the ip_sla collection mode the IP SLA
+config and 'show ip sla statistics aggregated') with IOS-formatted output,
+with configurable ping latency, loss, login delay and a share of dead hosts.
+
+    python ios_sim.py --devices 5000 --base-port 20000 --latency-ms 40 --loss 0.01 --dead 0.02
+
+Any username/password is accepted. The matching source list, one
+'SIM-<n> 127.0.0.1:<port>' line per router, is written with --sources-file.
+"""
+import argparse
+import asyncio
+import random
+import resource
+import time
+
+import asyncssh
+
+ROUTE_OUTPUT = '  * {primary}, from {primary}, 1w2d ago\n'
+BGP_OUTPUT = ('    {primary} from {primary} (10.255.255.1)\n'
+              '    {secondary} from {secondary} (10.255.255.2)\n')
+INVALID_INPUT = "\n% Invalid input detected at '^' marker.\n"
+
+
+class SimulatedRouter:
+    def __init__(self, name, latency_ms, jitter_ms, loss, auth_delay, rng):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.loss = loss
+        self.auth_delay = auth_delay
+        self.rng = rng
+        self.primary = '10.255.0.1'
+        self.secondary = '10.255.0.2'
+        self.mode = None
+        self.sla = {}
+        self.sla_entry = None
+
+    @property
+    def prompt(self):
+        return f'{self.name}({self.mode})#' if self.mode else f'{self.name}#'
+
+    def configure(self, command):
+        """The subset of IOS config mode the ip_sla collection mode uses."""
+        words = command.split()
+        if command == 'end':
+            self.mode = None
+        elif command == 'exit':
+            self.mode = 'config' if self.mode != 'config' else None
+        elif words[:2] == ['ip', 'sla'] and len(words) == 3:
+            self.sla_entry = int(words[2])
+            self.sla[self.sla_entry] = {'target': None, 'frequency': 60, 'started': None}
+            self.mode = 'config-ip-sla'
+        elif words[:3] == ['ip', 'sla', 'schedule'] and int(words[3]) in self.sla:
+            self.sla[int(words[3])]['started'] = time.monotonic()
+        elif words[:3] == ['no', 'ip', 'sla']:
+            self.sla.pop(int(words[3]), None)
+        elif words[0] == 'icmp-echo':
+            self.sla[self.sla_entry]['target'] = words[1]
+            self.mode = 'config-ip-sla-echo'
+        elif words[0] == 'frequency':
+            self.sla[self.sla_entry]['frequency'] = int(words[1])
+        return ''
+
+    def sla_statistics(self):
+        """Aggregated statistics, with a sample per `frequency` seconds since the schedule (at least one)."""
+        output = 'IPSLAs aggregated statistics\n\n'
+        for entry_id, operation in sorted(self.sla.items()):
+            if operation['started'] is None:
+                continue
+            count = min(60, max(1, int((time.monotonic() - operation['started']) / operation['frequency'])))
+            rtts = [max(1, int(self.rng.gauss(self.latency_ms, self.jitter_ms)))
+                    for _ in range(count) if self.rng.random() >= self.loss]
+            low, mean, high = (min(rtts), sum(rtts) // len(rtts), max(rtts)) if rtts else (0, 0, 0)
+            output += (f'IPSLA operation id: {entry_id}\n'
+                       'Type of operation: icmp-echo\n'
+                       'Start Time Index: 14:00:12 UTC Sun Oct 18 2026\n'
+                       'RTT Values:\n'
+                       f'        Number Of RTT: {len(rtts):<16} RTT Min/Avg/Max: {low}/{mean}/{high} milliseconds\n'
+                       f'Number of successes: {len(rtts)}\n'
+                       f'Number of failures: {count - len(rtts)}\n\n')
+        return output
+
+    async def ping(self, target, repeat=5, timeout=2):
+        replies = []
+        marks = ''
+        for _ in range(repeat):
+            if self.rng.random() < self.loss:
+                await asyncio.sleep(timeout)
+                marks += '.'
+            else:
+                rtt = max(1, int(self.rng.gauss(self.latency_ms, self.jitter_ms)))
+                await asyncio.sleep(rtt / 1000)
+                replies.append(rtt)
+                marks += '!'
+        output = ('Type escape sequence to abort.\n'
+                  f'Sending {repeat}, 100-byte ICMP Echos to {target}, timeout is {timeout} seconds:\n'
+                  'Packet sent with a source address of 10.20.30.1 \n'
+                  f'{marks}\n'
+                  f'Success rate is {len(replies) * 100 // repeat} percent ({len(replies)}/{repeat})')
+        if replies:
+            output += f', round-trip min/avg/max = {min(replies)}/{sum(replies) // len(replies)}/{max(replies)} ms'
+        return output + '\n'
+
+    async def run(self, command):
+        words = command.split()
+        if not words or words[0] == 'terminal':
+            return ''
+        if self.mode:
+            return self.configure(command)
+        if words[0] == 'configure':
+            self.mode = 'config'
+            return 'Enter configuration commands, one per line.  End with CNTL/Z.\n'
+        if command.startswith('show ip sla statistics'):
+            return self.sla_statistics()
+        if command.startswith('show ip route 0.0.0.0'):
+            return ROUTE_OUTPUT.format(primary=self.primary)
+        if command.startswith('show ip bgp 0.0.0.0'):
+            return BGP_OUTPUT.format(primary=self.primary, secondary=self.secondary)
+        if words[0] == 'ping' and len(words) >= 2:
+            repeat = int(words[words.index('repeat') + 1]) if 'repeat' in words else 5
+            return await self.ping(words[1], repeat=repeat)
+        return INVALID_INPUT
+
+
+class SimServer(asyncssh.SSHServer):
+    def __init__(self, router):
+        self.router = router
+
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    async def validate_password(self, username, password):
+        await asyncio.sleep(self.router.auth_delay)
+        return True
+
+
+async def run_shell(process, router):
+    process.stdout.write(f'\n{router.prompt}')
+    try:
+        while True:
+            line = await process.stdin.readline()
+            if not line:
+                break
+            command = line.strip()
+            if command in ('exit', 'logout') and not router.mode:
+                break
+            output = await router.run(command)
+            process.stdout.write(output + router.prompt)
+    except (asyncssh.BreakReceived, asyncssh.TerminalSizeChanged, ConnectionError):
+        pass
+    process.exit(0)
+
+
+async def accept_and_hang(reader, writer):
+    # A router that takes the TCP connection but never speaks SSH, like a hung control plane
+    await reader.read()
+    writer.close()
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def start_fleet(devices, base_port=20000, latency_ms=30, jitter_ms=5, loss=0.0, auth_delay=0.2,
+                      dead=0.0, dead_mode='refuse', seed=1, host='127.0.0.1'):
+    """
+    Start the simulated routers.
+
+    :param dead: Share of routers that are dead
+    :param dead_mode: 'refuse' (nothing listens) or 'hang' (TCP accepted, SSH never answers)
+    :return: (servers, source lines for office_wan_devices.txt)
+    """
+    rng = random.Random(seed)
+    host_key = asyncssh.generate_private_key('ssh-ed25519')
+    servers = []
+    sources = []
+    for i in range(devices):
+        port = base_port + i
+        name = f'SIM-{i:05d}'
+        sources.append(f'{name} {host}:{port}')
+        if rng.random() < dead:
+            if dead_mode == 'hang':
+                servers.append(await asyncio.start_server(accept_and_hang, host, port))
+            continue
+        router = SimulatedRouter(name, latency_ms, jitter_ms, loss, auth_delay, random.Random(rng.random()))
+        servers.append(await asyncssh.create_server(
+            lambda router=router: SimServer(router), host, port,
+            server_host_keys=[host_key],
+            process_factory=lambda process, router=router: run_shell(process, router)))
+    return servers, sources
+
+
+async def serve(args):
+    raise_fd_limit()
+    servers, sources = await start_fleet(
+        args.devices, base_port=args.base_port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        loss=args.loss, auth_delay=args.auth_delay, dead=args.dead, dead_mode=args.dead_mode,
+        seed=args.seed)
+    if args.sources_file:
+        with open(args.sources_file, 'w') as file:
+            file.write('\n'.join(sources) + '\n')
+    print(f"READY {args.devices} simulated routers on ports {args.base_port}-{args.base_port + args.devices - 1}",
+          flush=True)
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated Cisco IOS SSH fleet')
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--base-port', type=int, default=20000)
+    parser.add_argument('--latency-ms', type=float, default=30, help='Mean ping RTT')
+    parser.add_argument('--jitter-ms', type=float, default=5, help='Standard deviation of ping RTT')
+    parser.add_argument('--loss', type=float, default=0.0, help='Probability each echo is lost (costs the 2s timeout)')
+    parser.add_argument('--auth-delay', type=float, default=0.2, help='Seconds to accept a password')
+    parser.add_argument('--dead', type=float, default=0.0, help='Share of routers that are dead')
+    parser.add_argument('--dead-mode', choices=['refuse', 'hang'], default='refuse')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sources-file', help='Write the matching office_wan_devices.txt here')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
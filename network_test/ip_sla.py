@@ -0,0 +1,120 @@
+"""
+IP SLA collection mode: the routers measure continuously and net_test reads the statistics back.
+
+Each router gets one icmp-echo operation per DC and destination, numbered
+from `base_id` in the same order as the result columns. After that a run
+is a single 'show ip sla statistics aggregated' per router instead of one
+interactive ping per destination.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import ios_parsers
+
+logger = logging.getLogger(__name__)
+
+STATISTICS_COMMAND = 'show ip sla statistics aggregated'
+
+
+def operation_config(entry_id, target, source_int, frequency):
+    return [
+        f'no ip sla {entry_id}',
+        f'ip sla {entry_id}',
+        f' icmp-echo {target} source-interface {source_int}',
+        f' frequency {frequency}',
+        ' tag net_test',
+        'exit',
+        f'ip sla schedule {entry_id} life forever start-time now',
+    ]
+
+
+def parse_results(output, base_id, destination_names):
+    """
+    Map the statistics of operations base_id, base_id + 1, ... onto the result columns.
+
+    :return: (results dict in the ping schema, True if every operation was on the router)
+    """
+    operations = ios_parsers.parse_sla_statistics(output)
+    results = {}
+    complete = True
+    for offset, name in enumerate(destination_names):
+        operation = operations.get(base_id + offset)
+        if operation is None:
+            complete = False
+            results[name] = (None, None, None)
+        else:
+            results[name] = operation.times
+    return results, complete
+
+
+class SlaState:
+    """
+    Which targets each router was provisioned with, persisted to a JSON file.
+
+    A router is (re)provisioned when it has no entry, when its DCs, ping
+    source or the destination list change, or after forget() because its
+    operations went missing (a reload without 'write memory'). Safe to share
+    between threads.
+    """
+
+    def __init__(self, filename='sla_state.json', base_id=9000, frequency=60):
+        self.filename = filename
+        self.base_id = base_id
+        self.frequency = frequency
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename, 'r') as file:
+                entries = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring unreadable IP SLA state {self.filename}: {e}")
+            return
+        with self._lock:
+            self._entries = entries
+
+    def provision_commands(self, source_ip, dests_ips, source_int):
+        """Config lines that bring the router in line with dests_ips, [] if it already is."""
+        with self._lock:
+            entry = self._entries.get(source_ip)
+        if entry and entry['targets'] == list(dests_ips) and entry['source_int'] == source_int \
+                and entry['frequency'] == self.frequency:
+            return []
+        commands = []
+        for offset, target in enumerate(dests_ips):
+            commands += operation_config(self.base_id + offset, target, source_int, self.frequency)
+        # Drop operations left over from a longer destination list
+        previous = len(entry['targets']) if entry else 0
+        commands += [f'no ip sla {self.base_id + offset}' for offset in range(len(dests_ips), previous)]
+        return commands
+
+    def provisioned(self, source_ip, dests_ips, source_int):
+        with self._lock:
+            self._entries[source_ip] = {'targets': list(dests_ips), 'source_int': source_int,
+                                        'frequency': self.frequency, 'provisioned': time.time()}
+            self._dirty = True
+
+    def forget(self, source_ip):
+        with self._lock:
+            if self._entries.pop(source_ip, None) is not None:
+                self._dirty = True
+
+    def save(self):
+        """Write the state if anything changed; atomic so a crash never leaves half a file."""
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = dict(self._entries)
+            self._dirty = False
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as file:
+            json.dump(entries, file, indent=1)
+        os.replace(tmp_filename, self.filename)
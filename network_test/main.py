@@ -1,10 +1,284 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import FileResponse
+import asyncio
+import datetime
+import logging
+import os
+import socket
+
+import net_test
+import async_engine
+import precheck
+from ssh_pool import SessionPool
+from run_writer import RunWriter
+from runtime_history import RuntimeHistory
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+settings = net_test.net_test_config
+pool = SessionPool(
+    net_test.user, net_test.pwd,
+    max_size=settings.get('pool_max_size', 2500),
+    idle_timeout=settings.get('pool_idle_timeout', 1800),
+    keepalive_interval=settings.get('keepalive_interval', 60),
+    conn_timeout=settings.get('conn_timeout', 60),
+    read_timeout=settings.get('read_timeout', 30))
+
+# 'worker' replicas only run the shards central hands them, see central/net_test_shards.py
+role = os.environ.get('NET_TEST_ROLE', 'standalone')
+
+scheduler = {
+    'enabled': settings.get('scheduler', True) and role != 'worker',
+    'interval_minutes': settings.get('schedule_minutes', 15),
+    'running': False,
+    'last_start': None,
+    'last_duration': None,
+    'last_file': None,
+    'last_error': None,
+    'last_precheck': None,
+    'last_makespan': None,
+    'next_run': None,
+}
+background_tasks = []
+# Recent shards for GET /shards, oldest dropped past SHARD_HISTORY
+shards = {}
+SHARD_HISTORY = 200
+shard_lock = asyncio.Lock()
+
+
+def engine_settings():
+    """Keyword arguments for async_engine.run_async_pings shared by scheduled runs and shards."""
+    return {
+        'concurrency': settings.get('concurrency', 200),
+        'device_timeout': settings.get('device_timeout', 300),
+        'conn_timeout': settings.get('conn_timeout', 60),
+        'read_timeout': settings.get('read_timeout', 30),
+        'batch_pings': net_test.batch_pings,
+        'pool': pool,
+        'sla_state': net_test.sla_state if net_test.collection == 'ip_sla' else None,
+    }
+
+
+async def run_test_cycle():
+    """One full test over pooled sessions; the source files are re-read so edits apply without a restart."""
+    destinations = net_test.get_destinations()
+    sources = net_test.get_sources()
+    net_test.dc_cache.load_static(net_test.get_single_DC_sites())
+    filename = net_test.new_run_filename()
+    history = RuntimeHistory(filename=settings.get('runtime_history_file', 'device_runtimes.json'),
+                             default=settings.get('default_device_runtime', 30))
+    with RunWriter(filename, destinations, total=len(sources), store=net_test.results_store) as writer:
+        if settings.get('precheck', True):
+            sources, unreachable, scheduler['last_precheck'] = await precheck.split_reachable_async(
+                sources, **net_test.precheck_settings())
+            for source in unreachable:
+                source_name, source_ip = source.split(' ')
+                writer.write(source_ip, source_name, precheck.unreachable_results(destinations), 0)
+
+        def on_result(source_ip, source_name, results, elapsed):
+            history.record(source_ip, elapsed)
+            writer.write(source_ip, source_name, results, elapsed)
+
+        sources = history.order(sources)
+        predicted = history.predicted_makespan(sources, net_test.engine_workers('async'))
+        loop = asyncio.get_running_loop()
+        engine_start = loop.time()
+        await async_engine.run_async_pings(
+            sources, destinations, net_test.dc_cache, net_test.user, net_test.pwd,
+            on_result=on_result, **engine_settings())
+        scheduler['last_makespan'] = {'predicted': round(predicted, 1),
+                                      'actual': round(loop.time() - engine_start, 1)}
+    await asyncio.to_thread(history.save)
+    await asyncio.to_thread(net_test.fold_run, filename)
+    await asyncio.to_thread(net_test.dc_cache.save)
+    await asyncio.to_thread(net_test.sla_state.save)
+    return filename
+
+
+async def run_shard(status, sources, destinations):
+    """
+    Test one shard of a run sharded by central and return its rows instead of writing a CSV.
+
+    :return: List of [source_ip, source_name, results, elapsed]
+    """
+    rows = []
+    history = RuntimeHistory(filename=settings.get('runtime_history_file', 'device_runtimes.json'),
+                             default=settings.get('default_device_runtime', 30))
+    if settings.get('precheck', True):
+        sources, unreachable, _ = await precheck.split_reachable_async(sources, **net_test.precheck_settings())
+        for source in unreachable:
+            source_name, source_ip = source.split(' ')
+            rows.append([source_ip, source_name, precheck.unreachable_results(destinations), 0])
+
+    def on_result(source_ip, source_name, results, elapsed):
+        history.record(source_ip, elapsed)
+        rows.append([source_ip, source_name, results, round(elapsed, 2)])
+        status['done'] = len(rows)
+
+    await async_engine.run_async_pings(
+        history.order(sources), destinations, net_test.dc_cache, net_test.user, net_test.pwd,
+        on_result=on_result, **engine_settings())
+    await asyncio.to_thread(history.save)
+    await asyncio.to_thread(net_test.dc_cache.save)
+    await asyncio.to_thread(net_test.sla_state.save)
+    return rows
+
+
+async def run_dc_revalidation():
+    """Re-run DC discovery for cache entries about to expire, so test cycles keep getting cache hits."""
+    interval = settings.get('dc_revalidate_minutes', 60) * 60
+    semaphore = asyncio.Semaphore(settings.get('concurrency', 200))
+
+    async def revalidate(source_ip):
+        async with semaphore:
+            try:
+                await async_engine.revalidate_dcs(source_ip, net_test.dc_cache, pool,
+                                                  read_timeout=settings.get('read_timeout', 30))
+            except Exception as e:
+                # Leave the entry alone, it expires on its own and the next cycle rediscovers inline
+                logger.error(f"DC revalidation failed on {source_ip}: {e!r}")
+
+    while True:
+        await asyncio.sleep(interval)
+        stale = net_test.dc_cache.stale(within=interval + scheduler['interval_minutes'] * 60)
+        await asyncio.gather(*(revalidate(source_ip) for source_ip in stale))
+        await asyncio.to_thread(net_test.dc_cache.save)
+
+
+async def run_scheduler():
+    interval = scheduler['interval_minutes'] * 60
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        scheduler['running'] = True
+        scheduler['last_start'] = datetime.datetime.now().isoformat()
+        try:
+            scheduler['last_file'] = await run_test_cycle()
+            scheduler['last_error'] = None
+        except Exception as e:
+            logger.exception("Scheduled net test failed")
+            scheduler['last_error'] = repr(e)
+        scheduler['running'] = False
+        scheduler['last_duration'] = round(loop.time() - started, 1)
+        # Runs start on a fixed cadence; an overrunning cycle makes the next one start right away
+        delay = max(0, interval - (loop.time() - started))
+        scheduler['next_run'] = (datetime.datetime.now() + datetime.timedelta(seconds=delay)).isoformat()
+        await asyncio.sleep(delay)
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    pool.start()
+    if scheduler['enabled']:
+        background_tasks.append(asyncio.create_task(run_scheduler()))
+        background_tasks.append(asyncio.create_task(run_dc_revalidation()))
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    await pool.close()
+
+
 @app.get("/status")
 async def get_status():
     return {"status": "Service is running"}
 
 
+@app.get("/rollup/daily/{day}")
+async def get_daily_rollup(day: str):
+    return net_test.open_rollup().daily(day)
+
+
+@app.get("/rollup/hourly/{hour}")
+async def get_hourly_rollup(hour: str):
+    return net_test.open_rollup().hourly(hour)
+
+
+@app.get("/rollup/pairs/{period}/{key}")
+async def get_pair_rollup(period: str, key: str):
+    """Per source/destination percentiles: period is hourly (key YYYYMMDDHH), daily or weekly (key YYYYMMDD)."""
+    rollup = net_test.open_rollup()
+    readers = {'hourly': rollup.hourly_pairs, 'daily': rollup.daily_pairs, 'weekly': rollup.weekly_pairs}
+    if period not in readers:
+        raise HTTPException(status_code=404, detail="Period must be hourly, daily or weekly")
+    return await asyncio.to_thread(readers[period], key)
+
+
+@app.get("/results")
+async def get_results(source: str = None, destination: str = None, since: datetime.datetime = None,
+                      until: datetime.datetime = None, test_id: str = None):
+    """Ping results in long format, e.g. /results?source=10.1.1.1&destination=Primary-DC&since=2026-10-11"""
+    return await asyncio.to_thread(net_test.results_store.query, source_ip=source, destination=destination,
+                                   start=since, end=until, test_id=test_id)
+
+
+@app.get("/results/{test_id}.csv")
+async def export_results(test_id: str):
+    """One run in the original wide CSV layout."""
+    filename = os.path.join('net_tests', f'export_{test_id}.csv')
+    await asyncio.to_thread(net_test.results_store.export_csv, test_id, filename)
+    return FileResponse(filename, media_type='text/csv', filename=f'{test_id}.csv')
+
+
+@app.get("/inputs")
+async def get_inputs():
+    """The source and destination lists, re-read from disk, for central to shard."""
+    return {"sources": net_test.get_sources(), "destinations": net_test.get_destinations()}
+
+
+@app.post("/shards")
+async def post_shard(shard: dict):
+    """
+    Run one shard: {"run_id": ..., "shard_id": ..., "sources": ["name ip", ...], "destinations": [...]}.
+
+    Answers when the shard is done, with one row per source. One shard runs at
+    a time per worker; the session pool and DC cache stay warm between them.
+    """
+    shard_id = f"{shard['run_id']}/{shard['shard_id']}"
+    status = shards[shard_id] = {'sources': len(shard['sources']), 'done': 0, 'state': 'queued',
+                                 'received': datetime.datetime.now().isoformat()}
+    while len(shards) > SHARD_HISTORY:
+        shards.pop(next(iter(shards)))
+    async with shard_lock:
+        status['state'] = 'running'
+        try:
+            rows = await run_shard(status, shard['sources'], shard['destinations'])
+        except Exception as e:
+            logger.exception(f"Shard {shard_id} failed")
+            status['state'] = 'failed'
+            raise HTTPException(status_code=500, detail=f"Shard {shard_id} failed: {e!r}")
+        status['state'] = 'done'
+    return {"worker": socket.gethostname(), "shard_id": shard['shard_id'], "rows": rows}
+
+
+@app.get("/shards")
+async def get_shards():
+    return {"worker": socket.gethostname(), "role": role, "shards": shards, "pool": pool.status()}
+
+
+@app.post("/runs")
+async def post_run(run: dict):
+    """
+    Write a run whose rows were gathered elsewhere (central's merged shards) like a local run:
+    CSV, results store and rollup. {"destinations": [...], "rows": [[source_ip, name, results, elapsed], ...]}
+    """
+    filename = net_test.new_run_filename()
+
+    def write():
+        with RunWriter(filename, run['destinations'], total=len(run['rows']),
+                       store=net_test.results_store) as writer:
+            for source_ip, source_name, results, elapsed in run['rows']:
+                writer.write(source_ip, source_name, results, elapsed)
+        net_test.fold_run(filename)
+
+    await asyncio.to_thread(write)
+    return {"file": filename, "devices": len(run['rows'])}
+
 
+@app.get("/scheduler")
+async def get_scheduler():
+    return {"scheduler": scheduler, "pool": pool.status()}
@@ -4,13 +4,25 @@ import re
 import datetime
 import logging
 import yaml
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
+import argparse
+import time
+import ios_parsers
+import ip_sla
+import precheck
+from dc_cache import DCCache, DISCOVERY_COMMANDS, dc_ping_failed
+from run_writer import RunWriter, completed_sources, progress_filename
+from results_store import ResultsStore
+from runtime_history import RuntimeHistory
+from rollup import Rollup
 
 # Load the config file
 with open("config.yaml", "r") as file:
     config = yaml.safe_load(file)
 
+results_store = ResultsStore(directory=os.path.join('net_tests', 'store'))
+
 def get_time():
     # Current date and time
     now = datetime.datetime.now()
@@ -34,6 +46,11 @@ logging.basicConfig(filename='net-test.log', level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Optional tuning for net_test itself, every key has a default
+net_test_config = config.get('net_test') or {}
+
+batch_pings = net_test_config.get('batch_pings', True)
+
 user = config['network_devices']['cli_username']
 pwd = config['network_devices']['cli_password']
 
@@ -74,147 +91,243 @@ def get_single_DC_sites(filename='single_DC_sites.txt'):
 destinations = get_destinations()
 sources = get_sources()
 single_dc_sites = get_single_DC_sites()
+dc_cache = DCCache(filename=net_test_config.get('dc_cache_file', 'dc_cache.json'),
+                   ttl=net_test_config.get('dc_cache_ttl', 86400),
+                   single_dc_sites=single_dc_sites)
+# 'ping' runs interactive pings every run, 'ip_sla' reads the statistics of probes provisioned on the router
+collection = net_test_config.get('collection', 'ping')
+sla_state = ip_sla.SlaState(filename=net_test_config.get('sla_state_file', 'sla_state.json'),
+                            base_id=net_test_config.get('sla_base_id', 9000),
+                            frequency=net_test_config.get('sla_frequency', 60))
+
+def send_ping_batch(ssh, commands, read_timeout=30):
+    """
+    Send every ping to the router in one write and split the combined output.
+
+    IOS runs type-ahead commands one after another, so this is one exchange
+    instead of a blocking send_command round trip per destination.
+
+    :return: One output chunk per command, in the order sent
+    """
+    prompt = ssh.find_prompt()
+    ssh.write_channel(ssh.RETURN.join(commands) + ssh.RETURN)
+    output = ''
+    deadline = time.monotonic() + read_timeout * len(commands)
+    while not ios_parsers.batch_complete(output, prompt, len(commands)):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Ping batch did not finish within {read_timeout * len(commands)}s")
+        time.sleep(0.2)
+        output += ssh.read_channel()
+    return ios_parsers.split_batch_output(output, prompt, len(commands))
+
+def discover_dcs(ssh, source_ip):
+    """Find the primary and secondary DC from the routing table and cache them."""
+    def_route = ssh.send_command(DISCOVERY_COMMANDS[0])
+    primary_dc_ip = ios_parsers.parse_primary_dc(def_route)
+    sec_route = ssh.send_command(DISCOVERY_COMMANDS[1])
+    secondary_dc_ip = ios_parsers.parse_secondary_dc(sec_route, primary_dc_ip)
+    return dc_cache.put(source_ip, primary_dc_ip, secondary_dc_ip)
+
+def run_pings(ssh, dests_ips, source_int):
+    commands = [f'ping {dest_ip} source {source_int}' for dest_ip in dests_ips]
+    if batch_pings:
+        outputs = send_ping_batch(ssh, commands)
+    else:
+        outputs = [ssh.send_command(command, delay_factor=5, max_loops=1500, read_timeout=30) for command in commands]
+    return [ios_parsers.parse_ping(output).times for output in outputs]
+
+def collect_sla(ssh, source_ip, dests_ips, source_int, destination_names):
+    """
+    Read the router's IP SLA statistics, provisioning the operations first if they are missing or outdated.
+
+    Freshly provisioned operations have no samples yet, so that run pings interactively once.
+    """
+    commands = sla_state.provision_commands(source_ip, dests_ips, source_int)
+    if commands:
+        ssh.send_config_set(commands)
+        sla_state.provisioned(source_ip, dests_ips, source_int)
+        return dict(zip(destination_names, run_pings(ssh, dests_ips, source_int)))
+    output = ssh.send_command(ip_sla.STATISTICS_COMMAND, read_timeout=30)
+    results, complete = ip_sla.parse_results(output, sla_state.base_id, destination_names)
+    if not complete:
+        # Operations gone from the router (reloaded without write memory?), provision again next run
+        logger.error(f"IP SLA operations missing on {source_ip}")
+        sla_state.forget(source_ip)
+    return results
+
+def measure(ssh, source_ip, dests_ips, source_int, destination_names):
+    if collection == 'ip_sla':
+        return collect_sla(ssh, source_ip, dests_ips, source_int, destination_names)
+    return dict(zip(destination_names, run_pings(ssh, dests_ips, source_int)))
 
 def send_pings(source, destinations):
-    destination_names = ['Primary-DC', 'Secondary-DC']  
+    destination_names = ['Primary-DC', 'Secondary-DC'] + list(destinations)
     source_name, source_ip = source.split(' ')
+    host, port = precheck.split_host_port(source_ip)
     cisco_router = {
-        'device_type': 'cisco_ios', 'host': source_ip, 'username': user,
-        'password': pwd, 'secret': pwd, 'port': 22, 'timeout': 100, 'conn_timeout': 60
+        'device_type': 'cisco_ios', 'host': host, 'username': user,
+        'password': pwd, 'secret': pwd, 'port': port, 'timeout': 100, 'conn_timeout': 60
     }
-    dests_ips = []
     results = {}
     try:
         ssh = ConnectHandler(**cisco_router)
 
-        if source_ip in single_dc_sites:
-            primary_dc_ip = single_dc_sites[source_ip]['DC']
-            secondary_dc_ip = single_dc_sites[source_ip]['DC']
-            source_int = single_dc_sites[source_ip]['source_int']
-        else:
-        #get primary and secondary dcs
-            def_route = ssh.send_command('show ip route 0.0.0.0 | i , from')
-            primary_dc = re.findall(r'\d{1,3}.\d{1,3}.\d{1,3}.\d{1,3}', def_route)
-            primary_dc_ip = primary_dc[0]
-            sec_route = ssh.send_command('show ip bgp 0.0.0.0 | i from 1')
-            ips = re.findall(r' \d{1,3}.\d{1,3}.\d{1,3}.\d{1,3}', sec_route)
-            secondary_dc_ip = [ip for ip in ips if ip != primary_dc_ip][0]
-            source_int = 'lo0'
-        dests_ips.append(primary_dc_ip)
-        dests_ips.append(secondary_dc_ip)
-        for dest in destinations:
-            dests_ips.append(dest)
-            destination_names.append(dest)
-        x = 0
-        for dest_ip in dests_ips:       
-            #pinging once 
-          
-            print(ssh.send_command(f'ping {dest_ip} source {source_int}', delay_factor=5, max_loops=1500, read_timeout=30))
-            
-            output = ssh.send_command(f'ping {dest_ip} source {source_int}', delay_factor=5, max_loops=1500, read_timeout=30)
-            success_rate = re.search(r'Success rate is (\d+) percent', output)
-            response = re.findall(r'round-trip min/avg/max = \d+/\d+/\d+ ms', output)
-
-            if success_rate and int(success_rate.group(1)) > 0 and response[0]:
-                times = re.findall(r'\d+',response[0])
-                min_time = times[0]
-                avg_time = times[1]
-                max_time = times[2]
-                results[destination_names[x]]= min_time, avg_time, max_time
-            else:
-                results[destination_names[x]] = (None, None, None)
-            x = x + 1
+        #primary and secondary dcs come from the cache, discovery only runs on a miss
+        dc = dc_cache.get(source_ip)
+        cached = dc is not None
+        if not cached:
+            dc = discover_dcs(ssh, source_ip)
+        dests_ips = [dc['primary'], dc['secondary']] + list(destinations)
+        results = measure(ssh, source_ip, dests_ips, dc['source_int'], destination_names)
+
+        if cached and not dc.get('static') and dc_ping_failed(results):
+            # A cached DC that stops answering may have moved, check and re-ping only the DCs
+            try:
+                fresh = discover_dcs(ssh, source_ip)
+                if (fresh['primary'], fresh['secondary']) != (dc['primary'], dc['secondary']):
+                    dc_results = run_pings(ssh, [fresh['primary'], fresh['secondary']], fresh['source_int'])
+                    results.update(zip(destination_names[:2], dc_results))
+            except Exception as e:
+                logger.error(f"DC re-discovery failed on {source_ip}: {e}")
+                dc_cache.invalidate(source_ip)
         ssh.disconnect()
     except Exception as e:
         print(f"Failed to connect or send command to {source_ip}: {e}")
-        results = {destination_names[x]: ('ERROR', 'ERROR', 'ERROR') for dest_ip in dests_ips}
+        results = {name: ('ERROR', 'ERROR', 'ERROR') for name in destination_names}
 
     return source_ip, source_name, results
 
-def main():
+def timed_send_pings(source, destinations):
+    start = time.monotonic()
+    source_ip, source_name, results = send_pings(source, destinations)
+    return source_ip, source_name, results, time.monotonic() - start
+
+def run_thread_engine(sources, destinations, on_result):
+    """Original engine: one blocking netmiko session per worker thread."""
+    with ThreadPoolExecutor(max_workers=net_test_config.get('max_workers', 30)) as executor:
+        futures = [executor.submit(timed_send_pings, source, destinations) for source in sources]
+        # Completion order, so one router stuck on its timeout doesn't hold back every row after it
+        for future in as_completed(futures):
+            on_result(*future.result())
+
+def run_async_engine(sources, destinations, on_result):
+    """asyncssh engine: hundreds of sessions from one process, see async_engine.py."""
+    import async_engine  # asyncssh is only needed when this engine is selected
+    async_engine.run_engine(
+        sources, destinations, dc_cache, user, pwd,
+        concurrency=net_test_config.get('concurrency', 200),
+        device_timeout=net_test_config.get('device_timeout', 300),
+        conn_timeout=net_test_config.get('conn_timeout', 60),
+        read_timeout=net_test_config.get('read_timeout', 30),
+        batch_pings=batch_pings,
+        sla_state=sla_state if collection == 'ip_sla' else None,
+        on_result=on_result)
+
+ENGINES = {
+    'thread': run_thread_engine,
+    'async': run_async_engine,
+}
+
+def engine_workers(engine):
+    """How many devices the engine runs at once."""
+    if engine == 'async':
+        return net_test_config.get('concurrency', 200)
+    return net_test_config.get('max_workers', 30)
+
+def precheck_settings():
+    return {
+        'timeout': net_test_config.get('precheck_timeout', 3),
+        'concurrency': net_test_config.get('precheck_concurrency', 1000),
+        'conn_timeout': net_test_config.get('conn_timeout', 60),
+    }
+
+def new_run_filename():
     # Ensure the 'net_tests' directory exists
+    os.makedirs('net_tests', exist_ok=True)
+    # Generate the filename with the directory prepended
+    return 'net_tests/' + generate_test_id() + '.csv'
+
+def main(engine=None, resume=None):
+    """
+    Run the test against every source and stream the rows to CSV as devices finish.
+
+    :param resume: Path of an earlier run's CSV; only the sources missing from it are tested and appended
+    """
     now = get_time()
     print(now)
+    engine = engine or net_test_config.get('engine', 'thread')
 
-    os.makedirs('net_tests', exist_ok=True)
-    # Generate the filename with the directory prepended
-    filename = 'net_tests/' + generate_test_id() + '.csv'
-    with open(filename, 'w', newline='') as file:
-        writer = csv.writer(file)
-        # Adjust the header to include SourceName,SourceIP,'Primary-DC-min', 'Primary-DC-max', 'Primary-DC-avg', 'Secondary-DC-min', 'Secondary-DC-max', 'Secondary-DC-avg' then for each destination in destinations add min max and avg
-        headers = ['Source-IP', 'Name', 'Primary-DC-min', 'Primary-DC-max', 'Primary-DC-avg', 'Secondary-DC-min', 'Secondary-DC-max', 'Secondary-DC-avg']
-        for dest in destinations:
-            headers.append(dest + '-min')
-            headers.append(dest + '-avg')
-            headers.append(dest + '-max')
-        writer.writerow(headers)
+    run_sources = sources
+    if resume:
+        done = completed_sources(resume)
+        run_sources = [source for source in sources if source.split(' ')[1] not in done]
+        print(f"Resuming {resume}: {len(done)} devices done, {len(run_sources)} to go")
+    filename = resume or new_run_filename()
+    history = RuntimeHistory(filename=net_test_config.get('runtime_history_file', 'device_runtimes.json'),
+                             default=net_test_config.get('default_device_runtime', 30))
+    with RunWriter(filename, destinations, total=len(sources), resume=bool(resume), store=results_store) as writer:
+        if net_test_config.get('precheck', True):
+            run_sources, unreachable, _ = precheck.split_reachable(run_sources, **precheck_settings())
+            for source in unreachable:
+                source_name, source_ip = source.split(' ')
+                writer.write(source_ip, source_name, precheck.unreachable_results(destinations), 0)
+
+        def on_result(source_ip, source_name, results, elapsed):
+            history.record(source_ip, elapsed)
+            writer.write(source_ip, source_name, results, elapsed)
 
-        with ThreadPoolExecutor(max_workers=30) as executor:
-            futures = [executor.submit(send_pings, source, destinations) for source in sources]
-            for future in futures:
-                source_name, source_ip, results = future.result()
-                row = [source_name, source_ip]
-                row.extend(results.get('Primary-DC', (None, None, None)))
-                row.extend(results.get('Secondary-DC', (None, None, None)))
-                for dest in destinations:
-                    row.extend(results.get(dest, (None, None, None)))
-                writer.writerow(row)
+        # Slowest routers first, so a satellite site doesn't start last and stretch the run
+        run_sources = history.order(run_sources)
+        predicted = history.predicted_makespan(run_sources, engine_workers(engine))
+        engine_start = time.monotonic()
+        ENGINES[engine](run_sources, destinations, on_result)
+        actual = time.monotonic() - engine_start
+    history.save()
+    fold_run(filename)
+    print(f"Makespan: predicted {predicted:.0f}s, actual {actual:.0f}s for {len(run_sources)} devices")
+    dc_cache.save()
+    sla_state.save()
     then = get_time()
     diff = get_time_delta(then, now)
     print(then)
     print(now)
     print(diff)
 
-def aggregate_test_daily():
-    # Directory where individual test CSVs are stored
+def open_rollup():
+    return Rollup(filename=os.path.join('net_tests', 'rollup_state.json'),
+                  hour_retention_days=net_test_config.get('rollup_hour_retention_days', 14),
+                  sketch_dir=os.path.join('net_tests', 'sketches'))
+
+def fold_run(filename):
+    """Fold a finished run into the hourly/daily rollup, the only time its CSV is read back."""
+    rollup = open_rollup()
+    rollup.fold(filename)
+    rollup.save()
+    if not net_test_config.get('keep_run_csv', True):
+        # The store has every row; the run CSV was only the crash journal and can be exported again
+        os.remove(filename)
+        os.remove(progress_filename(filename))
+
+def aggregate_test_daily(day=None):
+    """
+    Write net_tests/daily_aggregate_YYYYMMDD.csv from the rollup checkpoint.
+
+    Runs are folded in as they finish, so this only reads the checkpoint;
+    run files the rollup has never seen (older runs, copied-in files) are
+    folded once first.
+
+    :param day: YYYYMMDD, defaults to today
+    """
     directory = 'net_tests'
-    
-    # Initialize dictionaries to store the aggregate values
-    aggregate_data = {}
-    file_count = 0
-
-    # Iterate over all CSV files in the directory
-    for filename in os.listdir(directory):
-        if filename.endswith('.csv'):
-            file_count += 1
-            filepath = os.path.join(directory, filename)
-            
-            with open(filepath, 'r') as file:
-                reader = csv.reader(file)
-                headers = next(reader)  # Skip the header row
-                
-                for row in reader:
-                    source_name = row[0]
-                    source_ip = row[1]
-                    
-                    # Aggregate data for each destination
-                    for i in range(2, len(row), 3):  # Skip source_name and source_ip
-                        dest_name = headers[i].replace('-min', '')
-                        min_time = int(row[i]) if row[i] and row[i] != 'None' else None
-                        avg_time = int(row[i+1]) if row[i+1] and row[i+1] != 'None' else None
-                        max_time = int(row[i+2]) if row[i+2] and row[i+2] != 'None' else None
-
-                        if dest_name not in aggregate_data:
-                            aggregate_data[dest_name] = {'min': min_time, 'max': max_time, 'avg': avg_time, 'avg_count': 1}
-                        else:
-                            if min_time is not None and (aggregate_data[dest_name]['min'] is None or min_time < aggregate_data[dest_name]['min']):
-                                aggregate_data[dest_name]['min'] = min_time
-                            if max_time is not None and (aggregate_data[dest_name]['max'] is None or max_time > aggregate_data[dest_name]['max']):
-                                aggregate_data[dest_name]['max'] = max_time
-                            if avg_time is not None:
-                                if aggregate_data[dest_name]['avg'] is None:
-                                    aggregate_data[dest_name]['avg'] = avg_time
-                                else:
-                                    aggregate_data[dest_name]['avg'] += avg_time
-                                aggregate_data[dest_name]['avg_count'] += 1
-    
-    # Calculate the final average for each destination
-    for dest_name, data in aggregate_data.items():
-        if data['avg'] is not None:
-            data['avg'] = data['avg'] / data['avg_count']
+    day = day or datetime.datetime.now().strftime('%Y%m%d')
+
+    rollup = open_rollup()
+    file_count = rollup.fold_pending(directory)
+    rollup.save()
+    aggregate_data = rollup.daily(day)
 
     # Write the aggregated data to a new CSV file
-    aggregated_filename = os.path.join(directory, 'daily_aggregate_' + datetime.datetime.now().strftime('%Y%m%d') + '.csv')
+    aggregated_filename = os.path.join(directory, 'daily_aggregate_' + day + '.csv')
     
     with open(aggregated_filename, 'w', newline='') as file:
         writer = csv.writer(file)
@@ -225,11 +338,41 @@ def aggregate_test_daily():
             row = [dest_name, data['min'], data['avg'], data['max']]
             writer.writerow(row)
     
-    print(f"Aggregated data from {file_count} files into {aggregated_filename}")
-    return(f"Aggregated data from {file_count} files into {aggregated_filename}")
+    print(f"Aggregated {day} from the rollup ({file_count} new files folded) into {aggregated_filename}")
+    return(f"Aggregated {day} from the rollup ({file_count} new files folded) into {aggregated_filename}")
 
 
+def aggregate_pairs(day=None, period='daily'):
+    """
+    Write net_tests/pair_percentiles_<period>_YYYYMMDD.csv: p50/p95/p99 and loss rate per source and destination.
+
+    :param period: 'daily', or 'weekly' for the seven days ending on `day`
+    """
+    day = day or datetime.datetime.now().strftime('%Y%m%d')
+    rollup = open_rollup()
+    rollup.fold_pending('net_tests')
+    rollup.save()
+    rows = rollup.weekly_pairs(day) if period == 'weekly' else rollup.daily_pairs(day)
+
+    filename = os.path.join('net_tests', f'pair_percentiles_{period}_{day}.csv')
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Source-IP', 'Destination', 'Samples', 'Loss Rate', 'p50', 'p95', 'p99'])
+        for row in rows:
+            writer.writerow([row['source'], row['destination'], row['samples'], row['loss_rate'],
+                             row['p50'], row['p95'], row['p99']])
+    print(f"Wrote {len(rows)} source/destination pairs into {filename}")
+    return filename
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Ping test from every WAN router')
+    parser.add_argument('--engine', choices=sorted(ENGINES), help='Overrides net_test.engine in config.yaml')
+    parser.add_argument('--resume', metavar='CSV', help='Finish an interrupted run, testing only the devices missing from CSV')
+    parser.add_argument('--export', metavar='TEST_ID', help='Write one run from the results store to net_tests/TEST_ID.csv and exit')
+    args = parser.parse_args()
+    if args.export:
+        print(results_store.export_csv(args.export, os.path.join('net_tests', args.export + '.csv')))
+    else:
+        main(engine=args.engine, resume=args.resume)
 
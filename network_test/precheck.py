@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def split_host_port(address, default_port=22):
+    """
+    Split a source address into host and SSH port.
+
+    Production sources are plain IPs; 'ip:port' is accepted so the lab
+    simulator (ios_sim.py) can stand in thousands of routers on one host.
+    """
+    host, _, port = address.partition(':')
+    return host, int(port) if port else default_port
+
+
+async def probe(host, port=22, timeout=3.0):
+    """True if a TCP connection to host:port opens within `timeout` seconds."""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+async def probe_all(hosts, port=22, timeout=3.0, concurrency=1000):
+    """Probe every host (or host:port) concurrently; returns {host: reachable}."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(address):
+        async with semaphore:
+            return await probe(*split_host_port(address, port), timeout)
+
+    reachable = await asyncio.gather(*(limited(host) for host in hosts))
+    return dict(zip(hosts, reachable))
+
+
+async def split_reachable_async(sources, port=22, timeout=3.0, concurrency=1000, conn_timeout=60):
+    """
+    Pre-flight TCP/22 check of 'name ip' source lines before any SSH login.
+
+    :param conn_timeout: SSH connect timeout a dead host would otherwise hold a worker for
+    :return: (live sources, unreachable sources, summary dict)
+    """
+    start = time.monotonic()
+    hosts = [source.split(' ')[1] for source in sources]
+    reachable = await probe_all(hosts, port, timeout, concurrency)
+    live = [source for source in sources if reachable[source.split(' ')[1]]]
+    dead = [source for source in sources if not reachable[source.split(' ')[1]]]
+    elapsed = time.monotonic() - start
+    summary = {
+        'probed': len(sources),
+        'unreachable': len(dead),
+        'elapsed': round(elapsed, 2),
+        'worker_seconds_saved': len(dead) * conn_timeout,
+    }
+    message = (f"Pre-check: {len(dead)}/{len(sources)} unreachable on TCP/{port} in {elapsed:.1f}s, "
+               f"saved ~{summary['worker_seconds_saved']} worker-seconds of SSH connect timeouts")
+    print(message)
+    logger.info(message)
+    return live, dead, summary
+
+
+def split_reachable(sources, **kwargs):
+    """Blocking wrapper of split_reachable_async for the thread engine."""
+    return asyncio.run(split_reachable_async(sources, **kwargs))
+
+
+def unreachable_results(destinations):
+    destination_names = ['Primary-DC', 'Secondary-DC'] + list(destinations)
+    return {name: ('UNREACHABLE', 'UNREACHABLE', 'UNREACHABLE') for name in destination_names}
@@ -0,0 +1,159 @@
+import csv
+import datetime
+import glob
+import os
+import sqlite3
+
+from run_writer import build_headers, build_row
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pings (
+    ts INTEGER NOT NULL,
+    test_id TEXT NOT NULL,
+    source_ip TEXT NOT NULL,
+    source_name TEXT,
+    destination TEXT NOT NULL,
+    min_ms REAL,
+    avg_ms REAL,
+    max_ms REAL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pings_source_ts ON pings (source_ip, ts);
+CREATE INDEX IF NOT EXISTS pings_ts ON pings (ts);
+CREATE INDEX IF NOT EXISTS pings_test_id ON pings (test_id);
+"""
+
+
+def test_id_time(test_id):
+    return datetime.datetime.strptime(test_id, 'NT%m%d%Y%H%M')
+
+
+def status_of(values):
+    """'ok', 'lost' (no reply) or the failure marker the engines write (ERROR / UNREACHABLE)."""
+    if values[0] in ('ERROR', 'UNREACHABLE'):
+        return values[0]
+    if values[0] is None:
+        return 'lost'
+    return 'ok'
+
+
+def to_ms(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ResultsStore:
+    """
+    Append-only ping results in long (source, destination, timestamp) layout.
+
+    One SQLite file per month (results_YYYYMM.db) keeps each file small and
+    lets old months be archived or dropped as a whole. Rows are indexed by
+    source and time. A connection is opened per call so the store can be
+    used from the engine thread and from API worker threads alike.
+    """
+
+    def __init__(self, directory='net_tests/store'):
+        self.directory = directory
+        self._initialized = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def _partition(self, when):
+        return os.path.join(self.directory, when.strftime('results_%Y%m.db'))
+
+    def _connect(self, filename):
+        conn = sqlite3.connect(filename)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        if filename not in self._initialized:
+            conn.executescript(SCHEMA)
+            self._initialized.add(filename)
+        return conn
+
+    def append(self, test_id, source_ip, source_name, results):
+        """Store one device's results dict (destination name -> (min, avg, max)) for a run."""
+        started = test_id_time(test_id)
+        ts = int(started.timestamp())
+        rows = [
+            (ts, test_id, source_ip, source_name, destination,
+             to_ms(values[0]), to_ms(values[1]), to_ms(values[2]), status_of(values))
+            for destination, values in results.items()
+        ]
+        conn = self._connect(self._partition(started))
+        try:
+            with conn:
+                conn.executemany('INSERT INTO pings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        finally:
+            conn.close()
+
+    def _partitions(self, start=None, end=None):
+        for filename in sorted(glob.glob(os.path.join(self.directory, 'results_*.db'))):
+            month = os.path.basename(filename)[8:14]
+            if start is not None and month < start.strftime('%Y%m'):
+                continue
+            if end is not None and month > end.strftime('%Y%m'):
+                continue
+            yield filename
+
+    def query(self, source_ip=None, destination=None, start=None, end=None, test_id=None):
+        """
+        Rows matching every given filter, oldest first.
+
+        :param start: datetime, inclusive
+        :param end: datetime, exclusive
+        :return: List of dicts with the pings table columns
+        """
+        if test_id is not None:
+            start = end = test_id_time(test_id)
+        clauses, params = [], []
+        for column, value in (('source_ip', source_ip), ('destination', destination), ('test_id', test_id)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if start is not None and test_id is None:
+            clauses.append('ts >= ?')
+            params.append(int(start.timestamp()))
+        if end is not None and test_id is None:
+            clauses.append('ts < ?')
+            params.append(int(end.timestamp()))
+        sql = 'SELECT * FROM pings'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY ts, rowid'
+
+        rows = []
+        for filename in self._partitions(start, end):
+            conn = self._connect(filename)
+            conn.row_factory = sqlite3.Row
+            try:
+                rows.extend(dict(row) for row in conn.execute(sql, params))
+            finally:
+                conn.close()
+        return rows
+
+    def export_csv(self, test_id, filename, destinations=None):
+        """
+        Rebuild the wide NT*.csv layout of one run, for tools that still read the old files.
+
+        :param destinations: Column order; defaults to the destinations stored for that run
+        """
+        rows = self.query(test_id=test_id)
+        if destinations is None:
+            destinations = [destination for destination in dict.fromkeys(row['destination'] for row in rows)
+                            if destination not in ('Primary-DC', 'Secondary-DC')]
+        devices = {}
+        for row in rows:
+            if row['status'] in ('ERROR', 'UNREACHABLE'):
+                values = (row['status'],) * 3
+            else:
+                values = tuple(None if row[column] is None else int(row[column])
+                               for column in ('min_ms', 'avg_ms', 'max_ms'))
+            device = devices.setdefault(row['source_ip'], (row['source_name'], {}))
+            device[1][row['destination']] = values
+        with open(filename, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(build_headers(destinations))
+            for source_ip, (source_name, results) in devices.items():
+                writer.writerow(build_row(source_ip, source_name, results, destinations))
+        return filename
@@ -0,0 +1,189 @@
+import csv
+import datetime
+import json
+import logging
+import os
+
+import numpy as np
+
+from sketches import PairSketches
+
+logger = logging.getLogger(__name__)
+
+
+def run_time(filename):
+    """Start time of a run from its NT%m%d%Y%H%M.csv name, or None for any other file."""
+    name = os.path.basename(filename)
+    try:
+        return datetime.datetime.strptime(name, 'NT%m%d%Y%H%M.csv')
+    except ValueError:
+        return None
+
+
+def to_number(value):
+    # Failed pings are written as None/ERROR/UNREACHABLE, only real times count
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_failure(value):
+    # ERROR/UNREACHABLE mean the router was never tested, not that the ping was lost
+    return value in ('ERROR', 'UNREACHABLE')
+
+
+class Rollup:
+    """
+    Running min/max/sum/count per destination for every hour and day, kept in a checkpoint file.
+
+    Each run CSV is folded in once, right after it is written, so reading a
+    daily or hourly summary never touches the raw files again. Hourly
+    buckets older than `hour_retention_days` are dropped; daily buckets
+    are small and kept.
+
+    Alongside, every (source, destination) pair gets a latency sketch per
+    hour and per day in `sketch_dir` (see sketches.PairSketches); weekly
+    percentiles are seven daily sketches merged.
+    """
+
+    def __init__(self, filename='net_tests/rollup_state.json', hour_retention_days=14,
+                 sketch_dir='net_tests/sketches'):
+        self.filename = filename
+        self.hour_retention_days = hour_retention_days
+        self.sketch_dir = sketch_dir
+        # 'folded_before' stands in for every file older than it, so 'folded' stays short
+        self.state = {'folded': [], 'folded_before': None, 'hours': {}, 'days': {}}
+        if os.path.exists(filename):
+            with open(filename, 'r') as file:
+                self.state = json.load(file)
+        self._folded = set(self.state['folded'])
+
+    @staticmethod
+    def _add(bucket, dest_name, min_time, avg_time, max_time):
+        stats = bucket.setdefault(dest_name, {'min': None, 'max': None, 'sum': 0.0, 'count': 0})
+        if min_time is not None and (stats['min'] is None or min_time < stats['min']):
+            stats['min'] = min_time
+        if max_time is not None and (stats['max'] is None or max_time > stats['max']):
+            stats['max'] = max_time
+        if avg_time is not None:
+            stats['sum'] += avg_time
+            stats['count'] += 1
+
+    def is_folded(self, filename):
+        started = run_time(filename)
+        watermark = self.state['folded_before']
+        return os.path.basename(filename) in self._folded or (
+            watermark is not None and started.strftime('%Y%m%d%H%M') < watermark)
+
+    def fold(self, filename):
+        """Fold one run CSV into the hourly and daily buckets. Returns False if it was already folded."""
+        name = os.path.basename(filename)
+        started = run_time(filename)
+        if started is None or self.is_folded(filename):
+            return False
+        hour = self.state['hours'].setdefault(started.strftime('%Y%m%d%H'), {})
+        day = self.state['days'].setdefault(started.strftime('%Y%m%d'), {})
+        pair_keys = []
+        pair_values = []
+        with open(filename, 'r', newline='') as file:
+            reader = csv.reader(file)
+            headers = next(reader)
+            for row in reader:
+                source_ip = row[0]
+                # Aggregate data for each destination, skipping Source-IP and Name
+                for i in range(2, len(row), 3):
+                    dest_name = headers[i].replace('-min', '')
+                    values = to_number(row[i]), to_number(row[i + 1]), to_number(row[i + 2])
+                    self._add(hour, dest_name, *values)
+                    self._add(day, dest_name, *values)
+                    if not is_failure(row[i + 1]):
+                        pair_keys.append((source_ip, dest_name))
+                        pair_values.append(np.nan if values[1] is None else values[1])
+        self._fold_sketches(started, pair_keys, pair_values)
+        self._folded.add(name)
+        self.state['folded'].append(name)
+        return True
+
+    def _sketch_file(self, period):
+        return os.path.join(self.sketch_dir, period + '.npz')
+
+    def _fold_sketches(self, started, pair_keys, pair_values):
+        os.makedirs(self.sketch_dir, exist_ok=True)
+        for period in ('H' + started.strftime('%Y%m%d%H'), 'D' + started.strftime('%Y%m%d')):
+            sketches = PairSketches.load(self._sketch_file(period))
+            sketches.add(pair_keys, pair_values)
+            sketches.save(self._sketch_file(period))
+
+    def fold_pending(self, directory='net_tests'):
+        """Fold run files written before the rollup existed or by another writer; each file is only ever read once."""
+        count = 0
+        for name in sorted(os.listdir(directory)):
+            if run_time(name) is not None and not self.is_folded(name):
+                count += self.fold(os.path.join(directory, name))
+        return count
+
+    def _prune(self):
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=self.hour_retention_days)).strftime('%Y%m%d%H')
+        for hour in [hour for hour in self.state['hours'] if hour < cutoff]:
+            del self.state['hours'][hour]
+        if os.path.isdir(self.sketch_dir):
+            for name in os.listdir(self.sketch_dir):
+                if name.startswith('H') and name.endswith('.npz') and name[1:11] < cutoff:
+                    os.remove(os.path.join(self.sketch_dir, name))
+        # Older files are covered by the watermark, no need to remember them by name
+        watermark = cutoff + '00'
+        self.state['folded_before'] = max(watermark, self.state['folded_before'] or watermark)
+        self.state['folded'] = [name for name in self.state['folded']
+                                if run_time(name).strftime('%Y%m%d%H%M') >= self.state['folded_before']]
+        self._folded = set(self.state['folded'])
+
+    def save(self):
+        self._prune()
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as file:
+            json.dump(self.state, file)
+        os.replace(tmp_filename, self.filename)
+
+    @staticmethod
+    def _summary(bucket):
+        return {
+            dest_name: {'min': stats['min'], 'max': stats['max'],
+                        'avg': stats['sum'] / stats['count'] if stats['count'] else None}
+            for dest_name, stats in bucket.items()
+        }
+
+    def daily(self, day):
+        """Summary for one day (YYYYMMDD): {destination: {'min', 'avg', 'max'}}."""
+        return self._summary(self.state['days'].get(day, {}))
+
+    def hourly(self, hour):
+        """Summary for one hour (YYYYMMDDHH): {destination: {'min', 'avg', 'max'}}."""
+        return self._summary(self.state['hours'].get(hour, {}))
+
+    def _pair_rows(self, sketches):
+        summary = sketches.summary()
+        rows = []
+        for i, (source_ip, dest_name) in enumerate(sketches.keys):
+            rows.append({
+                'source': source_ip, 'destination': dest_name,
+                'samples': int(summary['samples'][i]),
+                'loss_rate': round(float(summary['loss_rate'][i]), 4),
+                **{p: (None if np.isnan(summary[p][i]) else round(float(summary[p][i]), 1))
+                   for p in ('p50', 'p95', 'p99')},
+            })
+        return rows
+
+    def hourly_pairs(self, hour):
+        """p50/p95/p99 and loss rate per (source, destination) for one hour (YYYYMMDDHH)."""
+        return self._pair_rows(PairSketches.load(self._sketch_file('H' + hour)))
+
+    def daily_pairs(self, day):
+        """p50/p95/p99 and loss rate per (source, destination) for one day (YYYYMMDD)."""
+        return self._pair_rows(PairSketches.load(self._sketch_file('D' + day)))
+
+    def weekly_pairs(self, day):
+        """Same as daily_pairs for the seven days ending on `day`, merged from the daily sketches."""
+        end = datetime.datetime.strptime(day, '%Y%m%d')
+        days = [(end - datetime.timedelta(days=offset)).strftime('%Y%m%d') for offset in range(7)]
+        return self._pair_rows(PairSketches.merged([self._sketch_file('D' + d) for d in days]))
@@ -0,0 +1,121 @@
+import csv
+import datetime
+import json
+import os
+import time
+
+
+def build_headers(destinations):
+    # SourceName,SourceIP,'Primary-DC-min', 'Primary-DC-max', 'Primary-DC-avg', 'Secondary-DC-min', 'Secondary-DC-max', 'Secondary-DC-avg' then for each destination in destinations add min max and avg
+    headers = ['Source-IP', 'Name', 'Primary-DC-min', 'Primary-DC-max', 'Primary-DC-avg', 'Secondary-DC-min', 'Secondary-DC-max', 'Secondary-DC-avg']
+    for dest in destinations:
+        headers.append(dest + '-min')
+        headers.append(dest + '-avg')
+        headers.append(dest + '-max')
+    return headers
+
+
+def build_row(source_ip, source_name, results, destinations):
+    row = [source_ip, source_name]
+    row.extend(results.get('Primary-DC', (None, None, None)))
+    row.extend(results.get('Secondary-DC', (None, None, None)))
+    for dest in destinations:
+        row.extend(results.get(dest, (None, None, None)))
+    return row
+
+
+def progress_filename(filename):
+    return os.path.splitext(filename)[0] + '.progress.json'
+
+
+def completed_sources(filename):
+    """Source IPs that already have a row in a run CSV, i.e. what a resumed run can skip."""
+    with open(filename, 'r', newline='') as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        return {row[0] for row in reader if row}
+
+
+class RunWriter:
+    """
+    Writes one run's CSV row by row as devices finish, flushing each row.
+
+    Next to the CSV it keeps a <test id>.progress.json sidecar with the
+    number of devices done and each device's elapsed time. A run that dies
+    keeps every finished row, and resume=True appends the missing devices
+    to the same file.
+
+    With a results_store.ResultsStore every row is also appended to the store.
+    """
+
+    # Rewriting the sidecar on every row is wasteful on a 2,000 device run
+    PROGRESS_INTERVAL = 1.0
+
+    def __init__(self, filename, destinations, total, resume=False, store=None):
+        self.filename = filename
+        self.destinations = destinations
+        self.store = store
+        self.test_id = os.path.splitext(os.path.basename(filename))[0]
+        self.progress_filename = progress_filename(filename)
+        self._last_progress = 0
+        self.progress = {
+            'file': filename,
+            'started': datetime.datetime.now().isoformat(),
+            'finished': None,
+            'total': total,
+            'done': 0,
+            'devices': {},
+        }
+        headers = build_headers(destinations)
+        if resume:
+            with open(filename, 'r', newline='') as file:
+                existing_headers = next(csv.reader(file), None)
+            if existing_headers != headers:
+                raise ValueError(f"{filename} was written for a different test_destinations.txt, cannot resume it")
+            if os.path.exists(self.progress_filename):
+                with open(self.progress_filename, 'r') as file:
+                    self.progress.update(json.load(file))
+            self.progress['finished'] = None
+            self.progress['total'] = total
+            self.progress['done'] = len(completed_sources(filename))
+            self.file = open(filename, 'a', newline='')
+            self.writer = csv.writer(self.file)
+        else:
+            self.file = open(filename, 'w', newline='')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(headers)
+            self.file.flush()
+        self.save_progress()
+
+    def write(self, source_ip, source_name, results, elapsed):
+        self.writer.writerow(build_row(source_ip, source_name, results, self.destinations))
+        self.file.flush()
+        if self.store is not None:
+            self.store.append(self.test_id, source_ip, source_name, results)
+        self.progress['done'] += 1
+        self.progress['devices'][source_ip] = round(elapsed, 2)
+        if time.monotonic() - self._last_progress > self.PROGRESS_INTERVAL:
+            self.save_progress()
+
+    def save_progress(self):
+        self._last_progress = time.monotonic()
+        tmp_filename = self.progress_filename + '.tmp'
+        with open(tmp_filename, 'w') as file:
+            json.dump(self.progress, file, indent=1)
+        os.replace(tmp_filename, self.progress_filename)
+
+    def close(self):
+        self.file.close()
+        self.progress['finished'] = datetime.datetime.now().isoformat()
+        self.save_progress()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Leave 'finished' empty so the run shows up as resumable
+            self.file.close()
+            self.save_progress()
@@ -0,0 +1,60 @@
+import heapq
+import json
+import logging
+import os
+import statistics
+
+logger = logging.getLogger(__name__)
+
+
+class RuntimeHistory:
+    """
+    Per-device wall time from earlier runs, used to start the slowest routers first.
+
+    Each device keeps an exponentially weighted average of its elapsed time
+    so one odd run doesn't reorder the whole queue. Devices with no history
+    are expected to take the median of the known devices (or `default`
+    seconds when there is no history at all) - they are neither rushed to
+    the front nor left to the end.
+    """
+
+    def __init__(self, filename='device_runtimes.json', default=30.0, alpha=0.3):
+        self.filename = filename
+        self.default = default
+        self.alpha = alpha
+        self.runtimes = {}
+        if os.path.exists(filename):
+            try:
+                with open(filename, 'r') as file:
+                    self.runtimes = json.load(file)
+            except (OSError, ValueError) as e:
+                logger.error(f"Ignoring unreadable runtime history {filename}: {e}")
+        self._fallback = statistics.median(self.runtimes.values()) if self.runtimes else default
+
+    def expected(self, source_ip):
+        return self.runtimes.get(source_ip, self._fallback)
+
+    def record(self, source_ip, elapsed):
+        previous = self.runtimes.get(source_ip)
+        if previous is None:
+            self.runtimes[source_ip] = round(elapsed, 2)
+        else:
+            self.runtimes[source_ip] = round(self.alpha * elapsed + (1 - self.alpha) * previous, 2)
+
+    def order(self, sources):
+        """'name ip' source lines sorted longest-expected-first."""
+        return sorted(sources, key=lambda source: self.expected(source.split(' ')[1]), reverse=True)
+
+    def predicted_makespan(self, sources, workers):
+        """Wall time to run `sources` in the given order on `workers` parallel slots, from expected times."""
+        finish_times = [0.0] * max(1, min(workers, len(sources)))
+        for source in sources:
+            earliest = heapq.heappop(finish_times)
+            heapq.heappush(finish_times, earliest + self.expected(source.split(' ')[1]))
+        return max(finish_times)
+
+    def save(self):
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as file:
+            json.dump(self.runtimes, file, indent=1)
+        os.replace(tmp_filename, self.filename)
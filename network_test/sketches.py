@@ -0,0 +1,120 @@
+import math
+import os
+
+import numpy as np
+
+# Log-spaced buckets with 5% relative error: bucket i holds values in (GAMMA**(i-1), GAMMA**i].
+# IOS reports whole milliseconds, so 1 ms .. 2 minutes is ~125 buckets per (source, destination) pair.
+RELATIVE_ACCURACY = 0.05
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+MIN_VALUE = 1.0
+MAX_VALUE = 120000.0
+N_BUCKETS = int(math.ceil(math.log(MAX_VALUE / MIN_VALUE) / math.log(GAMMA))) + 1
+# Representative value of each bucket, within RELATIVE_ACCURACY of anything that landed in it
+BUCKET_VALUES = MIN_VALUE * 2 * GAMMA ** np.arange(N_BUCKETS) / (GAMMA + 1)
+BUCKET_VALUES[0] = MIN_VALUE
+
+
+class PairSketches:
+    """
+    One mergeable latency histogram per (source, destination) pair, stored as a NumPy matrix.
+
+    Merging two periods is adding their counts, so hourly sketches roll up
+    into days and days into weeks without keeping any raw sample. Lost
+    probes are counted next to the histogram for the loss rate.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.index = {}
+        self.counts = np.zeros((0, N_BUCKETS), dtype=np.uint32)
+        self.lost = np.zeros(0, dtype=np.uint32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _rows(self, keys):
+        new_keys = [key for key in dict.fromkeys(keys) if key not in self.index]
+        if new_keys:
+            for key in new_keys:
+                self.index[key] = len(self.keys)
+                self.keys.append(key)
+            self.counts = np.vstack([self.counts, np.zeros((len(new_keys), N_BUCKETS), dtype=np.uint32)])
+            self.lost = np.concatenate([self.lost, np.zeros(len(new_keys), dtype=np.uint32)])
+        return np.fromiter((self.index[key] for key in keys), dtype=np.int64, count=len(keys))
+
+    def add(self, keys, values):
+        """
+        Add one sample per key.
+
+        :param keys: List of (source, destination) tuples
+        :param values: RTTs in ms, NaN for a probe that got no reply
+        """
+        if not keys:
+            return
+        rows = self._rows(keys)
+        values = np.asarray(values, dtype=np.float64)
+        lost = np.isnan(values)
+        np.add.at(self.lost, rows[lost], 1)
+        clipped = np.clip(values[~lost], MIN_VALUE, MAX_VALUE)
+        buckets = np.ceil(np.log(clipped / MIN_VALUE) / math.log(GAMMA)).astype(np.int64)
+        np.add.at(self.counts, (rows[~lost], buckets), 1)
+
+    def merge(self, other):
+        """Add another PairSketches into this one in place and return self."""
+        if len(other):
+            rows = self._rows(other.keys)
+            self.counts[rows] += other.counts
+            self.lost[rows] += other.lost
+        return self
+
+    def summary(self, quantiles=(0.5, 0.95, 0.99)):
+        """
+        Percentiles and loss rate for every pair, vectorised over all pairs at once.
+
+        :return: dict of arrays aligned with self.keys: 'samples', 'loss_rate' and one 'pNN' per quantile
+        """
+        received = self.counts.sum(axis=1, dtype=np.int64)
+        total = received + self.lost
+        cumulative = np.cumsum(self.counts, axis=1, dtype=np.int64)
+        result = {
+            'samples': total,
+            'loss_rate': np.divide(self.lost, total, out=np.zeros(len(self.keys)), where=total > 0),
+        }
+        for quantile in quantiles:
+            # First bucket whose cumulative count reaches the rank of the quantile
+            rank = np.maximum(1, np.ceil(quantile * received))
+            bucket = (cumulative >= rank[:, None]).argmax(axis=1)
+            values = BUCKET_VALUES[bucket]
+            values[received == 0] = np.nan
+            result[f'p{round(quantile * 100)}'] = values
+        return result
+
+    def save(self, filename):
+        tmp_filename = filename + '.tmp.npz'
+        np.savez_compressed(
+            tmp_filename,
+            sources=np.array([key[0] for key in self.keys], dtype=str),
+            destinations=np.array([key[1] for key in self.keys], dtype=str),
+            counts=self.counts, lost=self.lost)
+        os.replace(tmp_filename, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """Load a saved sketch file; a missing file is an empty sketch."""
+        sketches = cls()
+        if not os.path.exists(filename):
+            return sketches
+        with np.load(filename) as data:
+            sketches.keys = list(zip(data['sources'].tolist(), data['destinations'].tolist()))
+            sketches.index = {key: row for row, key in enumerate(sketches.keys)}
+            sketches.counts = data['counts'].astype(np.uint32)
+            sketches.lost = data['lost'].astype(np.uint32)
+        return sketches
+
+    @classmethod
+    def merged(cls, filenames):
+        sketches = cls()
+        for filename in filenames:
+            sketches.merge(cls.load(filename))
+        return sketches
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+import asyncssh
+
+from async_engine import IOSSession
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the session itself is gone, as opposed to a parse problem
+SESSION_ERRORS = (OSError, EOFError, asyncssh.Error, asyncio.TimeoutError)
+
+
+class SessionPool:
+    """
+    Warm IOSSession objects keyed by device, for the long-running network_test service.
+
+    - one session per device, used by one caller at a time (per-device lock)
+    - keepalive: SSH keepalives plus an empty line on idle sessions so the vty exec-timeout never fires
+    - idle eviction after `idle_timeout` seconds without use
+    - at most `max_size` sessions; the least recently used idle one is closed to make room
+    - a warm session that fails is dropped and the call is retried once on a fresh login
+    """
+
+    def __init__(self, username, password, max_size=2500, idle_timeout=1800, keepalive_interval=60,
+                 conn_timeout=60, read_timeout=30):
+        self.username = username
+        self.password = password
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.conn_timeout = conn_timeout
+        self.read_timeout = read_timeout
+        self._sessions = OrderedDict()  # host -> IOSSession, least recently used first
+        self._last_used = {}
+        self._locks = {}
+        self._maintenance_task = None
+        self.stats = {'connects': 0, 'reuses': 0, 'reconnects': 0, 'evictions': 0}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _lock(self, host):
+        if host not in self._locks:
+            self._locks[host] = asyncio.Lock()
+        return self._locks[host]
+
+    def _discard(self, host):
+        session = self._sessions.pop(host, None)
+        self._last_used.pop(host, None)
+        if session is not None:
+            session.close()
+
+    async def _make_room(self):
+        # Only idle sessions can be closed; a busy one belongs to another caller
+        for host in list(self._sessions):
+            if len(self._sessions) < self.max_size:
+                return
+            if not self._lock(host).locked():
+                self._discard(host)
+                self.stats['evictions'] += 1
+
+    async def _checkout(self, host):
+        """Return (session, reused). Caller must hold the device lock."""
+        session = self._sessions.get(host)
+        if session is not None and not session.is_closed():
+            self._sessions.move_to_end(host)
+            self.stats['reuses'] += 1
+            return session, True
+        self._discard(host)
+        await self._make_room()
+        session = await IOSSession.connect(
+            host, self.username, self.password,
+            conn_timeout=self.conn_timeout, read_timeout=self.read_timeout,
+            keepalive_interval=self.keepalive_interval)
+        self._sessions[host] = session
+        self.stats['connects'] += 1
+        return session, False
+
+    async def run(self, host, func):
+        """
+        Run `await func(session)` on the pooled session for `host`.
+
+        :param func: Coroutine function taking an IOSSession
+        :return: Whatever func returns
+        """
+        loop = asyncio.get_running_loop()
+        async with self._lock(host):
+            session, reused = await self._checkout(host)
+            try:
+                result = await func(session)
+            except SESSION_ERRORS as e:
+                self._discard(host)
+                if not reused:
+                    raise
+                # The warm session went stale between cycles, log in again once
+                logger.info(f"Pooled session to {host} failed ({e!r}), reconnecting")
+                self.stats['reconnects'] += 1
+                session, reused = await self._checkout(host)
+                try:
+                    result = await func(session)
+                except SESSION_ERRORS:
+                    self._discard(host)
+                    raise
+            except asyncio.CancelledError:
+                # Device timeout hit mid-command, the output stream is out of step now
+                self._discard(host)
+                raise
+            self._last_used[host] = loop.time()
+            return result
+
+    async def _keepalive_and_evict(self):
+        loop = asyncio.get_running_loop()
+        for host in list(self._sessions):
+            lock = self._lock(host)
+            if lock.locked():
+                continue
+            async with lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    continue
+                if loop.time() - self._last_used.get(host, 0) > self.idle_timeout:
+                    self._discard(host)
+                    self.stats['evictions'] += 1
+                    continue
+                try:
+                    await session.send_command('', read_timeout=self.read_timeout)
+                except SESSION_ERRORS:
+                    self._discard(host)
+
+    async def maintain(self):
+        """Background loop: keepalive and idle eviction every keepalive_interval seconds."""
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            try:
+                await self._keepalive_and_evict()
+            except Exception:
+                logger.exception("Session pool maintenance failed")
+
+    def start(self):
+        if self._maintenance_task is None:
+            self._maintenance_task = asyncio.create_task(self.maintain())
+
+    async def close(self):
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            self._maintenance_task = None
+        for host in list(self._sessions):
+            self._discard(host)
+
+    def status(self):
+        return {'sessions': len(self._sessions), 'max_size': self.max_size, **self.stats}